@@ -0,0 +1,94 @@
+import glob
+import json
+import os
+import re
+import sys
+import timeit
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from google_maps_scraper_sse import HTML_PARSER, WebsiteDataExtractor  # noqa: E402
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', '*.html')
+ROUNDS = int(os.getenv('BENCH_ROUNDS', 20))
+
+SOCIAL_MEDIA = {
+    'facebook': r'facebook\.com/[A-Za-z0-9.]+',
+    'instagram': r'instagram\.com/[A-Za-z0-9_]+',
+    'twitter': r'twitter\.com/[A-Za-z0-9_]+',
+    'linkedin': r'linkedin\.com/[A-Za-z0-9_]+',
+    'youtube': r'youtube\.com/[A-Za-z0-9_]+',
+}
+
+
+# The extraction as it was before the single-pass parser: html.parser, one
+# tree walk per field and patterns compiled on every call.
+def legacy_schema_data(soup):
+    schema_data = {}
+    for script in soup.find_all('script', type='application/ld+json'):
+        try:
+            data = json.loads(script.string)
+            if isinstance(data, dict):
+                schema_data.update(data)
+            elif isinstance(data, list):
+                for item in data:
+                    if isinstance(item, dict):
+                        schema_data.update(item)
+        except:
+            continue
+    return schema_data
+
+
+def legacy_extract(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    schema_data = legacy_schema_data(soup)
+    meta_data = {}
+    for meta in soup.find_all('meta'):
+        name = meta.get('name', meta.get('property', ''))
+        content = meta.get('content', '')
+        if name and content:
+            meta_data[name] = content
+    text = soup.get_text()
+    emails = re.findall(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}', text)
+    phones = re.findall(r'(\+\d{1,3}[-.]?)?\s*\(?\d{3}\)?[-.]?\s*\d{3}[-.]?\s*\d{4}', text)
+    contact_links = [link['href'] for link in soup.find_all('a', href=re.compile(r'contact|about|get-in-touch|reach-us', re.I))[:2]]
+    social_media = {}
+    for platform, pattern in SOCIAL_MEDIA.items():
+        links = soup.find_all('a', href=re.compile(pattern, re.I))
+        if links:
+            social_media[platform] = list(set([link['href'] for link in links]))
+    hours = legacy_schema_data(soup).get('openingHours')
+    if hours is None:
+        hours_div = soup.find('div', class_=re.compile(r'hours|schedule|timing', re.I))
+        hours = hours_div.get_text(strip=True) if hours_div else None
+    price_range = soup.find(class_=re.compile(r'price-range|pricing', re.I))
+    cuisine = soup.find(class_=re.compile(r'cuisine|food-type', re.I))
+    return schema_data, meta_data, emails, phones, contact_links, social_media, hours, price_range, cuisine
+
+
+def single_pass_extract(extractor, html):
+    page = extractor._parse_page(BeautifulSoup(html, HTML_PARSER))
+    emails = extractor._extract_emails(page['text'])
+    phones = extractor._extract_phones(page['text'])
+    contact_links = [href for href in page['hrefs'] if extractor.CONTACT_LINK_PATTERN.search(href)][:2]
+    return (page['schema_data'], page['meta_data'], emails, phones, contact_links,
+            extractor._extract_social_media(page), extractor._extract_business_hours(page),
+            extractor._extract_additional_info(page))
+
+
+def main():
+    extractor = WebsiteDataExtractor()
+    print(f"parser backend: {HTML_PARSER}, rounds: {ROUNDS}")
+    for path in sorted(glob.glob(FIXTURES)):
+        with open(path, encoding='utf-8') as f:
+            html = f.read()
+        legacy = timeit.timeit(lambda: legacy_extract(html), number=ROUNDS) / ROUNDS
+        single_pass = timeit.timeit(lambda: single_pass_extract(extractor, html), number=ROUNDS) / ROUNDS
+        print(f"{os.path.basename(path):32} {len(html) / 1024:7.1f} KiB  "
+              f"legacy {legacy * 1000:8.2f} ms  single-pass {single_pass * 1000:8.2f} ms  "
+              f"speedup {legacy / single_pass:5.2f}x")
+
+
+if __name__ == '__main__':
+    main()
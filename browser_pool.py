@@ -0,0 +1,148 @@
+import asyncio
+import os
+import threading
+from contextlib import asynccontextmanager
+
+from playwright.async_api import async_playwright
+
+# Maximum number of pages leased at the same time across all jobs
+MAX_WORKERS = int(os.getenv('MAX_WORKERS', 10))
+# Number of Chromium processes the leased pages are spread over
+POOL_BROWSERS = int(os.getenv('POOL_BROWSERS', 2))
+# A browser is recycled after serving this many pages, to keep its memory in check
+POOL_PAGES_PER_BROWSER = int(os.getenv('POOL_PAGES_PER_BROWSER', 100))
+HEADLESS = os.getenv('HEADLESS', 'True').lower() != 'false'
+
+DEFAULT_VIEWPORT = {"width": 1920, "height": 1080}
+
+
+class PooledBrowser:
+    def __init__(self, browser):
+        self.browser = browser
+        self.active = 0
+        self.served = 0
+        self.retiring = False
+
+    def is_healthy(self):
+        return self.browser.is_connected() and not self.retiring
+
+
+class BrowserPool:
+    # Owns a long-lived event loop thread; scraping jobs are submitted to that
+    # loop so they can share the Playwright driver and its browsers.
+    def __init__(self, max_pages=MAX_WORKERS, max_browsers=POOL_BROWSERS, pages_per_browser=POOL_PAGES_PER_BROWSER, headless=HEADLESS):
+        self.max_pages = max_pages
+        self.max_browsers = max_browsers
+        self.pages_per_browser = pages_per_browser
+        self.headless = headless
+        self.loop = None
+        self.browsers = []
+        self._playwright = None
+        self._thread = None
+        self._semaphore = None
+        self._lock = None
+
+    def start(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="browser-pool", daemon=True)
+        self._thread.start()
+        self.submit(self._start()).result()
+        return self
+
+    def submit(self, coro):
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    async def _start(self):
+        self._semaphore = asyncio.Semaphore(self.max_pages)
+        self._lock = asyncio.Lock()
+        self._playwright = await async_playwright().start()
+
+    async def _launch(self):
+        browser = await self._playwright.chromium.launch(headless=self.headless)
+        entry = PooledBrowser(browser)
+        browser.on("disconnected", lambda _: self._forget(entry))
+        self.browsers.append(entry)
+        return entry
+
+    def _forget(self, entry):
+        if entry in self.browsers:
+            self.browsers.remove(entry)
+
+    async def _acquire_browser(self):
+        async with self._lock:
+            for entry in list(self.browsers):
+                if not entry.browser.is_connected():
+                    self._forget(entry)
+            healthy = [entry for entry in self.browsers if entry.is_healthy()]
+            entry = min(healthy, key=lambda entry: entry.active, default=None)
+            if entry is None or (entry.active > 0 and len(self.browsers) < self.max_browsers):
+                entry = await self._launch()
+            entry.active += 1
+            entry.served += 1
+            if entry.served >= self.pages_per_browser:
+                entry.retiring = True
+            return entry
+
+    async def _release_browser(self, entry):
+        entry.active -= 1
+        if entry.retiring and entry.active == 0:
+            self._forget(entry)
+            try:
+                await entry.browser.close()
+            except Exception:
+                pass
+
+    @asynccontextmanager
+    async def context(self, viewport=DEFAULT_VIEWPORT, resource_policy=None):
+        async with self._semaphore:
+            entry = await self._acquire_browser()
+            try:
+                context = await entry.browser.new_context(viewport=viewport)
+                try:
+                    if resource_policy is not None:
+                        await resource_policy.install(context)
+                    yield context
+                finally:
+                    try:
+                        await context.close()
+                    except Exception:
+                        pass
+            finally:
+                await self._release_browser(entry)
+
+    @asynccontextmanager
+    async def page(self, viewport=DEFAULT_VIEWPORT, resource_policy=None):
+        async with self.context(viewport=viewport, resource_policy=resource_policy) as context:
+            yield await context.new_page()
+
+    def stats(self):
+        return {
+            "browsers": len(self.browsers),
+            "active_pages": sum(entry.active for entry in self.browsers),
+            "max_pages": self.max_pages,
+        }
+
+    async def _close(self):
+        for entry in list(self.browsers):
+            self._forget(entry)
+            try:
+                await entry.browser.close()
+            except Exception:
+                pass
+        await self._playwright.stop()
+
+    def close(self):
+        self.submit(self._close()).result()
+        self.loop.call_soon_threadsafe(self.loop.stop)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_browser_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = BrowserPool().start()
+        return _pool
@@ -0,0 +1,90 @@
+import asyncio
+import os
+import time
+from collections import deque
+
+# Detail pages scraped in parallel when a job starts; the limiter adapts it from there
+ADAPTIVE_INITIAL_LIMIT = int(os.getenv('ADAPTIVE_INITIAL_LIMIT', 4))
+ADAPTIVE_MIN_LIMIT = int(os.getenv('ADAPTIVE_MIN_LIMIT', 1))
+# Per-listing latency (seconds) above which parallelism stops growing and is cut
+ADAPTIVE_TARGET_LATENCY = float(os.getenv('ADAPTIVE_TARGET_LATENCY', 45))
+# Share of failed listings among the recent ones that counts as an error spike
+ADAPTIVE_ERROR_RATE = float(os.getenv('ADAPTIVE_ERROR_RATE', 0.3))
+# Load average per CPU above which parallelism stops growing
+ADAPTIVE_MAX_LOAD = float(os.getenv('ADAPTIVE_MAX_LOAD', 1.5))
+
+# Outcomes that always make the limiter back off
+BACKOFF_OUTCOMES = ('timeout', 'consent')
+
+
+def cpu_load():
+    try:
+        return os.getloadavg()[0] / (os.cpu_count() or 1)
+    except (AttributeError, OSError):
+        return 0.0
+
+
+class AdaptiveLimiter:
+    # AIMD limiter: every healthy completion adds 1/limit to the limit (about +1
+    # per round of in-flight tasks), while timeouts, consent walls, error spikes,
+    # slow listings or CPU overload halve it, at most once per round.
+    def __init__(self, maximum, initial=ADAPTIVE_INITIAL_LIMIT, minimum=ADAPTIVE_MIN_LIMIT, target_latency=ADAPTIVE_TARGET_LATENCY,
+                 error_rate=ADAPTIVE_ERROR_RATE, max_load=ADAPTIVE_MAX_LOAD, decrease_factor=0.5, on_change=None):
+        self.maximum = max(1, maximum)
+        self.minimum = max(1, min(minimum, self.maximum))
+        self.target_latency = target_latency
+        self.error_rate = error_rate
+        self.max_load = max_load
+        self.decrease_factor = decrease_factor
+        self.on_change = on_change
+        self._limit = float(max(self.minimum, min(initial, self.maximum)))
+        self.in_flight = 0
+        self.outcomes = deque(maxlen=20)
+        self.history = []  # (timestamp, limit) after every change
+        self._last_decrease = 0.0
+        self._condition = asyncio.Condition()
+
+    @property
+    def limit(self):
+        return int(self._limit)
+
+    async def acquire(self):
+        async with self._condition:
+            await self._condition.wait_for(lambda: self.in_flight < self.limit)
+            self.in_flight += 1
+
+    async def release(self):
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def record(self, latency, outcome='ok'):
+        self.outcomes.append(outcome)
+        errors = sum(1 for recent in self.outcomes if recent != 'ok')
+        error_spike = len(self.outcomes) >= 5 and errors / len(self.outcomes) > self.error_rate
+        load = cpu_load()
+        if outcome in BACKOFF_OUTCOMES or error_spike or latency > self.target_latency or load > self.max_load:
+            self._decrease()
+        elif outcome == 'ok':
+            self._set_limit(self._limit + 1 / self._limit)
+
+    def _decrease(self):
+        # One cut per round: the tasks already in flight started under the old limit
+        now = time.monotonic()
+        if now - self._last_decrease < self.target_latency / 2:
+            return
+        self._last_decrease = now
+        self._set_limit(self._limit * self.decrease_factor)
+
+    def _set_limit(self, limit):
+        previous = self.limit
+        self._limit = max(self.minimum, min(float(self.maximum), limit))
+        if self.limit != previous:
+            self.history.append((time.time(), self.limit))
+            asyncio.ensure_future(self._notify())
+            if self.on_change:
+                self.on_change(self.limit, previous)
+
+    async def _notify(self):
+        async with self._condition:
+            self._condition.notify_all()
@@ -0,0 +1,166 @@
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+
+from jobs import send_update
+
+# Records per request when results are delivered to the API
+API_BATCH_SIZE = int(os.getenv('API_BATCH_SIZE', 100))
+# Seconds to wait for the API to answer one batch
+API_TIMEOUT = int(os.getenv('API_TIMEOUT', 30))
+# Retries per batch after a timeout, connection error, 429 or 5xx answer
+API_MAX_RETRIES = int(os.getenv('API_MAX_RETRIES', 5))
+# First retry delay in seconds; it doubles with every further retry
+API_BACKOFF = float(os.getenv('API_BACKOFF', 1.0))
+API_MAX_BACKOFF = 60
+# Send request bodies gzip-compressed (Content-Encoding: gzip)
+API_GZIP = os.getenv('API_GZIP', 'True').lower() != 'false'
+# Batches that could not be delivered are kept here and replayed before the next delivery
+API_OUTBOX_DIR = os.getenv('API_OUTBOX_DIR', 'outbox')
+# The server's own API key and the endpoint it belongs to; the key is never
+# sent to any other endpoint
+API_KEY = os.getenv('DEFAULT_API_KEY', '')
+API_DEFAULT_ENDPOINT = os.getenv('DEFAULT_API_ENDPOINT', '')
+
+RETRY_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+
+def endpoint_base(endpoint):
+    # Scheme, host and path; the query only carries per-job values such as searchTerm
+    parts = urlsplit(endpoint or '')
+    return (parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip('/'))
+
+
+def default_api_key(endpoint):
+    if API_KEY and API_DEFAULT_ENDPOINT and endpoint_base(endpoint) == endpoint_base(API_DEFAULT_ENDPOINT):
+        return API_KEY
+    return ''
+
+
+def idempotency_key(*parts):
+    return hashlib.sha256('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+
+
+class ApiDelivery:
+    def __init__(self, max_retries=API_MAX_RETRIES, backoff=API_BACKOFF, timeout=API_TIMEOUT, compress=API_GZIP, outbox_dir=API_OUTBOX_DIR):
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.compress = compress
+        self.outbox_dir = outbox_dir
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=4)
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+        self._outbox_lock = threading.Lock()
+        self._api_keys = {}  # endpoint -> key of the latest delivery to it
+
+    def _retry_delay(self, attempt, retry_after=None):
+        if retry_after and retry_after.isdigit():
+            return min(int(retry_after), API_MAX_BACKOFF)
+        return min(self.backoff * 2 ** attempt, API_MAX_BACKOFF) * random.uniform(0.5, 1.0)
+
+    def send_batch(self, endpoint, api_key, document, key, retries=None):
+        retries = self.max_retries if retries is None else retries
+        body = json.dumps(document).encode('utf-8')
+        headers = {'Content-Type': 'application/json', 'Idempotency-Key': key}
+        if self.compress:
+            body = gzip.compress(body)
+            headers['Content-Encoding'] = 'gzip'
+        if api_key:
+            headers['Authorization'] = f'Bearer {api_key}'
+        for attempt in range(retries + 1):
+            retry_after = None
+            try:
+                response = self.session.post(endpoint, data=body, headers=headers, timeout=self.timeout)
+                if 200 <= response.status_code < 300:
+                    return True
+                if response.status_code not in RETRY_STATUSES:
+                    send_update({"status": "error", "message": f"API request failed with status code: {response.status_code}, Response: {response.text[:500]}"})
+                    return False
+                error = f"status code {response.status_code}"
+                retry_after = response.headers.get('Retry-After')
+            except requests.RequestException as e:
+                error = str(e)
+            if attempt < retries:
+                delay = self._retry_delay(attempt, retry_after)
+                send_update({"status": "warning", "message": f"API request failed ({error}), retrying in {delay:.1f}s"})
+                time.sleep(delay)
+        send_update({"status": "error", "message": f"API request failed after {retries + 1} attempts: {error}"})
+        return False
+
+    def deliver(self, endpoint, api_key, batches):
+        # batches yields (idempotency key, document); returns (sent, queued in the outbox)
+        self._api_keys[endpoint] = api_key
+        self.replay_outbox()
+        sent = queued = 0
+        for key, document in batches:
+            if self.send_batch(endpoint, api_key, document, key):
+                sent += 1
+            else:
+                self._to_outbox(endpoint, key, document)
+                queued += 1
+        return sent, queued
+
+    def _outbox_path(self, key):
+        return os.path.join(self.outbox_dir, f'{key}.json.gz')
+
+    def _to_outbox(self, endpoint, key, document):
+        os.makedirs(self.outbox_dir, exist_ok=True)
+        path = self._outbox_path(key)
+        with gzip.open(path + '.tmp', 'wt', encoding='utf-8') as f:
+            json.dump({'endpoint': endpoint, 'key': key, 'created_at': time.time(), 'document': document}, f)
+        os.replace(path + '.tmp', path)
+
+    def pending(self):
+        if not os.path.isdir(self.outbox_dir):
+            return []
+        return sorted(name[:-len('.json.gz')] for name in os.listdir(self.outbox_dir) if name.endswith('.json.gz'))
+
+    def replay_outbox(self, endpoint=None, api_key=None):
+        # One attempt per batch; what still fails stays for the next replay.
+        # With endpoint, only that endpoint's batches are sent, with api_key if
+        # given; otherwise each batch uses the key last delivered to its
+        # endpoint, or the default key for the default endpoint.
+        with self._outbox_lock:
+            sent = failed = 0
+            for key in self.pending():
+                path = self._outbox_path(key)
+                try:
+                    with gzip.open(path, 'rt', encoding='utf-8') as f:
+                        entry = json.load(f)
+                except (OSError, ValueError):
+                    continue
+                if endpoint is not None and endpoint_base(entry['endpoint']) != endpoint_base(endpoint):
+                    continue
+                if endpoint is not None and api_key is not None:
+                    endpoint_key = api_key
+                else:
+                    endpoint_key = self._api_keys.get(entry['endpoint'], default_api_key(entry['endpoint']))
+                if self.send_batch(entry['endpoint'], endpoint_key, entry['document'], entry['key'], retries=0):
+                    os.remove(path)
+                    sent += 1
+                else:
+                    failed += 1
+            if sent or failed:
+                send_update({"status": "info", "message": f"Replayed API outbox: {sent} batches delivered, {failed} still pending"})
+            return sent, failed
+
+
+_api_delivery = None
+_api_delivery_lock = threading.Lock()
+
+
+def get_api_delivery():
+    global _api_delivery
+    with _api_delivery_lock:
+        if _api_delivery is None:
+            _api_delivery = ApiDelivery()
+        return _api_delivery
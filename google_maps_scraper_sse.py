@@ -1,30 +1,72 @@
 from playwright.sync_api import sync_playwright
-from playwright.async_api import async_playwright
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
 import pandas as pd
 import argparse
 import re
 import requests
-from bs4 import BeautifulSoup
-from urllib.parse import urljoin
+from bs4 import BeautifulSoup, CData, NavigableString, Tag
+from urllib.parse import urljoin, urlparse
 import json
+import codecs
 from typing import Dict, List, Optional
 import time
 import os
 from tqdm import tqdm
-from flask import Flask, Response, request, send_file
-import queue
+from flask import Flask, Response, request, send_file, send_from_directory
+import contextvars
 import threading
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import AsyncExitStack, asynccontextmanager
 from dotenv import load_dotenv
 import traceback
 import asyncio  # Add asyncio import
 from flask_cors import CORS
+from browser_pool import get_browser_pool
+from resource_policy import ResourcePolicy
+from concurrency import AdaptiveLimiter
+from place_cache import FIELD_GROUPS, get_place_cache, parse_field_groups, skipped_fields
+from place_index import get_place_index
+from reviews import REVIEWS_PER_SORT, collect_review_sets, review_columns
+from web_results import resolve_map_socials
+from http_cache import get_http_cache
+from journal import JobJournal, prune_journals, unfinished_journals
+from output import OUTPUT_DEDUPE_COLUMNS, OUTPUT_PRUNE_COLUMNS, ResultWriter, iter_api_batches, output_path, postprocess_csv, write_api_payload
+from delivery import API_BATCH_SIZE, default_api_key, get_api_delivery, idempotency_key
+from parquet_export import PARQUET_DIR, PARQUET_EXPORT, ParquetResultWriter, build_parquet_row, partition_path
+from jobs import JobScheduler, Sweep, current_job, is_cancelled, job_registry, send_update, sse_stream
 # Load environment variables from .env file
 load_dotenv()
 
+# lxml parses several times faster than the pure-Python html.parser, use it when installed
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = 'lxml'
+except ImportError:
+    HTML_PARSER = 'html.parser'
+# Website fetches stop reading after this many bytes
+MAX_PAGE_BYTES = int(os.getenv('MAX_PAGE_BYTES', 2 * 1024 * 1024))
+# Content types parsed by the website extractor; anything else is skipped
+HTML_CONTENT_TYPES = ('text/html', 'application/xhtml+xml')
+# String types BeautifulSoup's get_text() returns; script, style and comment strings are skipped
+VISIBLE_STRING_TYPES = (NavigableString, CData)
+
 app = Flask(__name__, template_folder='templates')
 CORS(app, resources={r"/*": {"origins": "*"}})
-update_queue = queue.Queue()
+
+# How long discovery waits for the results feed to grow after a scroll before giving up (ms)
+SCROLL_IDLE_TIMEOUT = int(os.getenv('SCROLL_IDLE_TIMEOUT', 15000))
+# Number of concurrent workers for each pipeline stage; for place details this
+# is the ceiling of the adaptive limiter
+DETAIL_WORKERS = int(os.getenv('DETAIL_WORKERS', 10))
+WEBSITE_WORKERS = int(os.getenv('WEBSITE_WORKERS', 20))
+FACEBOOK_WORKERS = int(os.getenv('FACEBOOK_WORKERS', 4))
+# Upper bound for waiting on a Facebook page's intro section (ms)
+FACEBOOK_WAIT_TIMEOUT = int(os.getenv('FACEBOOK_WAIT_TIMEOUT', 8000))
+# Websites fetched at the same time across all jobs, and per host
+WEBSITE_CONCURRENCY = int(os.getenv('WEBSITE_CONCURRENCY', 20))
+WEBSITE_PER_HOST = int(os.getenv('WEBSITE_PER_HOST', 2))
+# Restart jobs whose journal has no completion entry when the server starts (e.g. after a crash)
+RESUME_JOBS_ON_START = os.getenv('RESUME_JOBS_ON_START', 'False').lower() == 'true'
 
 
 @app.route('/download/<filename>', methods=['GET'])
@@ -41,104 +83,248 @@ def download_file(filename):
                          download_name=filename)
     except Exception as e:
         return {"status": "error", "message": f"Error downloading file: {str(e)}"}, 500
+
+
+# Parquet exports live in partition directories below PARQUET_DIR
+@app.route('/download/parquet/<path:filename>', methods=['GET'])
+def download_parquet(filename):
+    if not os.path.isfile(os.path.join(PARQUET_DIR, filename)):
+        return {"status": "error", "message": f"File {filename} not found"}, 404
+    return send_from_directory(os.path.abspath(PARQUET_DIR), filename, mimetype='application/vnd.apache.parquet', as_attachment=True)
     
-# SSE route to stream progress updates
+# SSE route to stream progress updates of a job; resumes after Last-Event-ID
 @app.route('/stream')
 def stream():
-    def event_stream():
-        while True:
-            message = update_queue.get()
-            if message == "DONE":
-                yield "data: {\"status\": \"complete\"}\n\n"
-                break
-            yield f"data: {json.dumps(message)}\n\n"
-    
-    return Response(event_stream(), mimetype="text/event-stream")
+    job_id = request.args.get('job_id')
+    job = job_registry.get(job_id) if job_id else job_registry.latest()
+    if job is None:
+        return {"status": "error", "message": f"Job {job_id} not found"}, 404
+    last_event_id = request.headers.get('Last-Event-ID', request.args.get('last_event_id', 0))
+    try:
+        last_event_id = int(last_event_id)
+    except ValueError:
+        last_event_id = 0
+    return Response(sse_stream(job, last_event_id), mimetype="text/event-stream", headers={'X-Job-ID': job.id})
 
 @app.route('/scrape', methods=['GET'])
 def scrape():
     # Get parameters from URL query string
-    search_query = request.args.get('search_query', f'Salon in austria')
-    total_results = int(request.args.get('total_results', 1000))
-    api_endpoint = request.args.get('api_endpoint', f'http://3.75.61.76:3000/api/google-maps?searchTerm={search_query}')
-    api_key = request.args.get('api_key', '')
-
     # Store parameters in app context
-    app.config['SCRAPE_PARAMS'] = {
+    app.config['SCRAPE_PARAMS'] = read_scrape_params(request.args)
+
+    # Every job gets its own event channel, so concurrent jobs never see each other's updates
+    job = submit_scrape_job(app.config['SCRAPE_PARAMS'])
+    return Response(sse_stream(job), mimetype="text/event-stream", headers={'X-Job-ID': job.id})
+
+
+def get_job_scheduler():
+    global _job_scheduler
+    with _job_scheduler_lock:
+        if _job_scheduler is None:
+            _job_scheduler = JobScheduler().start(get_browser_pool().loop)
+        return _job_scheduler
+
+
+_job_scheduler = None
+_job_scheduler_lock = threading.Lock()
+
+
+def submit_scrape_job(params, priority=0, submitter=None, job_id=None, sweep=None):
+    # Passing the job_id of an earlier job resumes it from its journal
+    job = job_registry.create(params, job_id=job_id)
+    journal = JobJournal(job.id)
+    if job_id is None:
+        # The API key is never written to disk; a resume has to pass it again
+        journal.append('params', params={key: value for key, value in params.items() if key != 'api_key'})
+    else:
+        journal.append('resumed')
+    if sweep is not None:
+        sweep.add_child(job)
+    get_job_scheduler().submit(job, lambda: run_scraper(
+        params['search_query'], params['total_results'], params.get('api_endpoint'), params.get('api_key'), params.get('scroll_idle_timeout'),
+        journal=journal, sweep=sweep, field_groups=params.get('fields')
+    ), priority=priority, submitter=submitter or request.remote_addr)
+    return job
+
+
+def resume_unfinished_jobs():
+    for journal in unfinished_journals():
+        params = journal.replay()['params']
+        if params is None:
+            continue
+        # Jobs can name any endpoint, so only the server's own endpoint gets the server's key
+        params = {**params, 'api_key': default_api_key(params.get('api_endpoint'))}
+        job = submit_scrape_job(params, submitter='resume', job_id=journal.job_id)
+        print(f"Resuming job {job.id}: {params['search_query']}")
+
+
+def read_scrape_params(values):
+    search_query = values.get('search_query', f'Salon in austria')
+    return {
         'search_query': search_query,
-        'total_results': total_results,
-        'api_endpoint': api_endpoint,
-        'api_key': api_key
+        'total_results': int(values.get('total_results', 1000)),
+        'api_endpoint': values.get('api_endpoint', f'http://3.75.61.76:3000/api/google-maps?searchTerm={search_query}'),
+        'api_key': values.get('api_key', ''),
+        'scroll_idle_timeout': int(values.get('scroll_idle_timeout', SCROLL_IDLE_TIMEOUT)),
+        'fields': parse_field_groups(values.get('fields')),
     }
 
-    # Clear any existing queue
-    while not update_queue.empty():
-            update_queue.get()
-
-        
-    # With this solution:
-    def thread_worker(search_query, total_results, api_endpoint, api_key):
-        loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(loop)
-        try:
-            loop.run_until_complete(run_scraper(search_query, total_results, api_endpoint, api_key))
-        finally:
-            loop.close()
-
-    # Then start the thread with this worker function
-    threading.Thread(target=thread_worker, args=(search_query, total_results, api_endpoint, api_key)).start()
-    def event_stream():
-        while True:
-            message = update_queue.get()
-            if message == "DONE":
-                yield "data: {\"status\": \"complete\"}\n\n"
-                break
-            yield f"data: {json.dumps(message)}\n\n"
-    
-    return Response(event_stream(), mimetype="text/event-stream")
-
-# Function to send updates to the client
-def send_update(message):
-    update_queue.put(message)
 
+@app.route('/jobs', methods=['POST'])
+def create_job():
+    values = {**request.args.to_dict(), **request.form.to_dict(), **(request.get_json(silent=True) or {})}
+    try:
+        params = read_scrape_params(values)
+        priority = int(values.get('priority', 0))
+    except ValueError as e:
+        return {"status": "error", "message": f"Invalid job parameters: {str(e)}"}, 400
+    job = submit_scrape_job(params, priority=priority, submitter=values.get('submitter'))
+    return {**job.to_dict(), "position": get_job_scheduler().position(job)}, 202
+
+
+# One sub-job per location; they share the browser pool, the caches and a
+# place ID set, so a place found in several locations is scraped only once
+@app.route('/sweeps', methods=['POST'])
+def create_sweep():
+    values = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    query_template = values.get('query_template', '')
+    locations = values.get('locations') or []
+    if isinstance(locations, str):
+        locations = [location.strip() for location in locations.split(',') if location.strip()]
+    if '{location}' not in query_template or not locations:
+        return {"status": "error", "message": "A sweep needs a query_template containing {location} and a list of locations"}, 400
+    try:
+        priority = int(values.get('priority', 0))
+        children = []
+        for location in locations:
+            params = read_scrape_params({**values, 'search_query': query_template.replace('{location}', location)})
+            children.append({**params, 'location': location})
+    except ValueError as e:
+        return {"status": "error", "message": f"Invalid sweep parameters: {str(e)}"}, 400
+    sweep = job_registry.create({'query_template': query_template, 'locations': locations}, job_class=Sweep)
+    submitter = values.get('submitter') or request.remote_addr
+    for params in children:
+        submit_scrape_job(params, priority=priority, submitter=submitter, sweep=sweep)
+    sweep.publish({"status": "info", "message": f"Sweep {sweep.id} queued {len(children)} locations"})
+    return sweep.to_dict(), 202
+
+
+@app.route('/jobs', methods=['GET'])
+def list_jobs():
+    scheduler = get_job_scheduler()
+    return {**scheduler.stats(), "jobs": [job.to_dict() for job in job_registry.all()]}
+
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_job(job_id):
+    job = job_registry.get(job_id)
+    if job is None:
+        return {"status": "error", "message": f"Job {job_id} not found"}, 404
+    return {**job.to_dict(), "position": get_job_scheduler().position(job)}
+
+
+@app.route('/jobs/<job_id>/resume', methods=['POST'])
+def resume_job(job_id):
+    job = job_registry.get(job_id)
+    if job is not None and not job.done:
+        return {"status": "error", "message": f"Job {job_id} is already {job.state}"}, 409
+    state = JobJournal(job_id).replay()
+    if state['params'] is None:
+        return {"status": "error", "message": f"No journal found for job {job_id}"}, 404
+    if state['status'] == 'complete':
+        return {"status": "error", "message": f"Job {job_id} already completed"}, 409
+    values = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    try:
+        priority = int(values.get('priority', 0))
+    except ValueError as e:
+        return {"status": "error", "message": f"Invalid job parameters: {str(e)}"}, 400
+    params = {**state['params'], 'api_key': values.get('api_key', '')}
+    job = submit_scrape_job(params, priority=priority, submitter=values.get('submitter'), job_id=job_id)
+    return {**job.to_dict(), "position": get_job_scheduler().position(job)}, 202
+
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    job = job_registry.get(job_id)
+    if job is None:
+        return {"status": "error", "message": f"Job {job_id} not found"}, 404
+    if not get_job_scheduler().cancel(job):
+        return {"status": "error", "message": f"Job {job_id} is already {job.state}"}, 409
+    # Running jobs record their cancellation themselves; queued ones never start
+    for cancelled in job.children if isinstance(job, Sweep) else [job]:
+        if cancelled.started_at is None and cancelled.state == 'cancelled':
+            JobJournal(cancelled.id).append('cancelled')
+    return job.to_dict(), 202
+
+
+@app.route('/outbox', methods=['GET'])
+def list_outbox():
+    return {"pending_batches": get_api_delivery().pending()}
+
+
+@app.route('/outbox/replay', methods=['POST'])
+def replay_outbox():
+    values = {**request.args.to_dict(), **(request.get_json(silent=True) or {})}
+    # A key is only ever sent to the endpoint it was given for
+    if values.get('api_key') is not None and not values.get('endpoint'):
+        return {"status": "error", "message": "api_key needs the endpoint it belongs to"}, 400
+    sent, failed = get_api_delivery().replay_outbox(values.get('endpoint'), values.get('api_key'))
+    return {"delivered": sent, "pending": failed}
 
 
 class WebsiteDataExtractor:
-    def __init__(self):
+    EMAIL_PATTERN = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}')
+    PHONE_PATTERN = re.compile(r'(\+\d{1,3}[-.]?)?\s*\(?\d{3}\)?[-.]?\s*\d{3}[-.]?\s*\d{4}')
+    SOCIAL_MEDIA_PATTERNS = {
+        'facebook': re.compile(r'facebook\.com/[A-Za-z0-9.]+', re.I),
+        'instagram': re.compile(r'instagram\.com/[A-Za-z0-9_]+', re.I),
+        'twitter': re.compile(r'twitter\.com/[A-Za-z0-9_]+', re.I),
+        'linkedin': re.compile(r'linkedin\.com/[A-Za-z0-9_]+', re.I),
+        'youtube': re.compile(r'youtube\.com/[A-Za-z0-9_]+', re.I),
+    }
+    CONTACT_LINK_PATTERN = re.compile(r'contact|about|get-in-touch|reach-us', re.I)
+    HOURS_CLASS_PATTERN = re.compile(r'hours|schedule|timing', re.I)
+    PRICE_RANGE_CLASS_PATTERN = re.compile(r'price-range|pricing', re.I)
+    CUISINE_CLASS_PATTERN = re.compile(r'cuisine|food-type', re.I)
+    IMAGE_SUFFIXES = ('.png', '.jpg', '.gif', '.jpeg')
+    CHARSET_PATTERN = re.compile(r'charset=["\']?([\w-]+)', re.I)
+    META_CHARSET_PATTERN = re.compile(rb'<meta[^>]+charset=["\']?([\w-]+)', re.I)
+
+    def __init__(self, session=None, executor=None, http_cache=None):
+        self.session = session
+        self.executor = executor  # used to fetch contact pages in parallel
+        self.http_cache = http_cache
         self.patterns = {
-            'email': r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}',
-            'phone': r'(\+\d{1,3}[-.]?)?\s*\(?\d{3}\)?[-.]?\s*\d{3}[-.]?\s*\d{4}',
-            'social_media': {
-                'facebook': r'facebook\.com/[A-Za-z0-9.]+',
-                'instagram': r'instagram\.com/[A-Za-z0-9_]+',
-                'twitter': r'twitter\.com/[A-Za-z0-9_]+',
-                'linkedin': r'linkedin\.com/[A-Za-z0-9_]+',
-                'youtube': r'youtube\.com/[A-Za-z0-9_]+',
-            }
+            'email': self.EMAIL_PATTERN,
+            'phone': self.PHONE_PATTERN,
+            'social_media': self.SOCIAL_MEDIA_PATTERNS,
         }
 
     def extract_structured_data(self, url: str) -> Dict:
         if not url or url == "N/A" or url == "Null":
             return self._get_empty_result()
         try:
-            session = self._create_session()
-            soup = self._get_page_content(url, session)
+            session = self.session or self._create_session()
+            page = self._parse_page(self._get_page_content(url, session))
             data = {
                 'url': url,
-                'structured_data': self._extract_schema_data(soup),
-                'meta_data': self._extract_meta_data(soup),
-                'contact_info': self._extract_contact_info(soup, url, session),
-                'social_media': self._extract_social_media(soup),
-                'business_hours': self._extract_business_hours(soup),
-                'additional_info': self._extract_additional_info(soup)
+                'structured_data': page['schema_data'],
+                'meta_data': page['meta_data'],
+                'contact_info': self._extract_contact_info(page, url, session),
+                'social_media': self._extract_social_media(page),
+                'business_hours': self._extract_business_hours(page),
+                'additional_info': self._extract_additional_info(page)
             }
             return data
         except Exception as e:
             send_update({"status": "error", "message": f"Error extracting data from {url}: {str(e)}"})
             return self._get_empty_result()
 
-    def _create_session(self):
+    def _create_session(self, pool_size=10):
         session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
         session.verify = False
         session.headers.update({
             'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36',
@@ -152,123 +338,238 @@ class WebsiteDataExtractor:
             url = 'https://' + url
         for attempt in range(3):
             try:
-                response = session.get(url, timeout=20)
-                return BeautifulSoup(response.text, 'html.parser')
+                return BeautifulSoup(self._fetch_html(url, session, timeout=20) or '', HTML_PARSER)
             except:
                 if attempt == 2:
                     raise
                 time.sleep(1)
 
-    def _extract_schema_data(self, soup: BeautifulSoup) -> Dict:
-        schema_data = {}
-        scripts = soup.find_all('script', type='application/ld+json')
-        for script in scripts:
+    def _fetch_html(self, url: str, session, timeout: int) -> Optional[str]:
+        # Streams the body and stops at MAX_PAGE_BYTES; PDFs, images and other
+        # non-HTML responses are skipped without downloading them. With an HTTP
+        # cache, fresh entries skip the request and stale ones are revalidated.
+        cached = self.http_cache.get(url) if self.http_cache else None
+        if cached and cached.is_fresh(self.http_cache.max_age):
+            return self._decode_html(cached.content_type, cached.body)
+        headers = cached.conditional_headers() if cached else None
+        with session.get(url, timeout=timeout, stream=True, headers=headers) as response:
+            if cached and response.status_code == 304:
+                self.http_cache.refresh(url)
+                return self._decode_html(cached.content_type, cached.body)
+            content_type = response.headers.get('Content-Type', '').lower()
+            body = bytearray()
+            if self._is_html(content_type):
+                for chunk in response.iter_content(chunk_size=16384):
+                    body.extend(chunk)
+                    if len(body) >= MAX_PAGE_BYTES:
+                        del body[MAX_PAGE_BYTES:]
+                        break
+            if self.http_cache and response.status_code == 200:
+                self.http_cache.put(url, content_type, body, response.headers.get('ETag'), response.headers.get('Last-Modified'))
+        return self._decode_html(content_type, body)
+
+    def _is_html(self, content_type: str) -> bool:
+        return not content_type or any(html_type in content_type for html_type in HTML_CONTENT_TYPES)
+
+    def _decode_html(self, content_type: str, body: bytes) -> Optional[str]:
+        if not self._is_html(content_type):
+            return None
+        return bytes(body).decode(self._detect_encoding(content_type, body), errors='replace')
+
+    def _detect_encoding(self, content_type: str, body: bytes) -> str:
+        if body.startswith(codecs.BOM_UTF8):
+            return 'utf-8-sig'
+        match = self.CHARSET_PATTERN.search(content_type) or self.META_CHARSET_PATTERN.search(body[:4096])
+        if match:
+            encoding = match.group(1)
+            encoding = encoding.decode('ascii', 'ignore') if isinstance(encoding, bytes) else encoding
             try:
-                data = json.loads(script.string)
-                if isinstance(data, dict):
-                    schema_data.update(data)
-                elif isinstance(data, list):
-                    for item in data:
-                        if isinstance(item, dict):
-                            schema_data.update(item)
-            except:
-                continue
-        return schema_data
-
-    def _extract_meta_data(self, soup: BeautifulSoup) -> Dict:
-        meta_data = {}
-        for meta in soup.find_all('meta'):
-            name = meta.get('name', meta.get('property', ''))
-            content = meta.get('content', '')
-            if name and content:
-                meta_data[name] = content
-        return meta_data
-
-    def _extract_contact_info(self, soup: BeautifulSoup, url: str, session) -> Dict:
+                return codecs.lookup(encoding).name
+            except LookupError:
+                pass
+        return 'utf-8'
+
+    def _parse_page(self, soup: BeautifulSoup) -> Dict:
+        # Collects everything the extractors need in a single walk over the tree
+        page = {'schema_data': {}, 'meta_data': {}, 'hrefs': [], 'text': [], 'hours': None, 'price_range': None, 'cuisine': None}
+        for node in soup.descendants:
+            if isinstance(node, Tag):
+                if node.name == 'a':
+                    href = node.get('href')
+                    if href:
+                        page['hrefs'].append(href)
+                elif node.name == 'meta':
+                    name = node.get('name', node.get('property', ''))
+                    content = node.get('content', '')
+                    if name and content:
+                        page['meta_data'][name] = content
+                elif node.name == 'script' and node.get('type') == 'application/ld+json':
+                    self._merge_schema_data(page['schema_data'], node.string)
+
+                classes = node.get('class')
+                if classes:
+                    classes = ' '.join(classes)
+                    if page['hours'] is None and node.name == 'div' and self.HOURS_CLASS_PATTERN.search(classes):
+                        page['hours'] = node
+                    if page['price_range'] is None and self.PRICE_RANGE_CLASS_PATTERN.search(classes):
+                        page['price_range'] = node
+                    if page['cuisine'] is None and self.CUISINE_CLASS_PATTERN.search(classes):
+                        page['cuisine'] = node
+            elif type(node) in VISIBLE_STRING_TYPES:
+                page['text'].append(node)
+        page['text'] = ''.join(page['text'])
+        return page
+
+    def _merge_schema_data(self, schema_data: Dict, script_text: Optional[str]):
+        try:
+            data = json.loads(script_text)
+            if isinstance(data, dict):
+                schema_data.update(data)
+            elif isinstance(data, list):
+                for item in data:
+                    if isinstance(item, dict):
+                        schema_data.update(item)
+        except:
+            pass
+
+    def _extract_contact_info(self, page: Dict, url: str, session) -> Dict:
         contact_info = {'emails': [], 'phones': [], 'address': None}
-        text = soup.get_text()
+        text = page['text']
         contact_info['emails'] = self._extract_emails(text)
         contact_info['phones'] = self._extract_phones(text)
-        contact_links = soup.find_all('a', href=re.compile(r'contact|about|get-in-touch|reach-us', re.I))
-        for link in contact_links[:2]:
-            try:
-                contact_url = urljoin(url, link['href'])
-                response = session.get(contact_url, timeout=10)
-                contact_soup = BeautifulSoup(response.text, 'html.parser')
-                contact_text = contact_soup.get_text()
+        contact_hrefs = [href for href in page['hrefs'] if self.CONTACT_LINK_PATTERN.search(href)]
+        contact_urls = [urljoin(url, href) for href in contact_hrefs[:2]]
+        fetch = lambda contact_url: self._get_contact_text(contact_url, session)
+        contact_texts = self.executor.map(fetch, contact_urls) if self.executor else map(fetch, contact_urls)
+        for contact_text in contact_texts:
+            if contact_text:
                 contact_info['emails'].extend(self._extract_emails(contact_text))
                 contact_info['phones'].extend(self._extract_phones(contact_text))
-            except:
-                continue
         contact_info['emails'] = list(set(contact_info['emails']))
         contact_info['phones'] = list(set(contact_info['phones']))
         return contact_info
 
-    def _extract_social_media(self, soup: BeautifulSoup) -> Dict:
+    def _get_contact_text(self, contact_url: str, session) -> Optional[str]:
+        try:
+            html = self._fetch_html(contact_url, session, timeout=10)
+            return BeautifulSoup(html, HTML_PARSER).get_text() if html else None
+        except:
+            return None
+
+    def _extract_social_media(self, page: Dict) -> Dict:
         social_media = {}
-        for platform, pattern in self.patterns['social_media'].items():
-            links = soup.find_all('a', href=re.compile(pattern, re.I))
+        for platform, pattern in self.SOCIAL_MEDIA_PATTERNS.items():
+            links = [href for href in page['hrefs'] if pattern.search(href)]
             if links:
-                social_media[platform] = list(set([link['href'] for link in links]))
+                social_media[platform] = list(set(links))
         return social_media
 
-    def _extract_business_hours(self, soup: BeautifulSoup) -> Optional[Dict]:
-        schema_data = self._extract_schema_data(soup)
-        if 'openingHours' in schema_data:
-            return schema_data['openingHours']
-        hours_div = soup.find('div', class_=re.compile(r'hours|schedule|timing', re.I))
-        if hours_div:
-            return {'raw': hours_div.get_text(strip=True)}
+    def _extract_business_hours(self, page: Dict) -> Optional[Dict]:
+        if 'openingHours' in page['schema_data']:
+            return page['schema_data']['openingHours']
+        if page['hours'] is not None:
+            return {'raw': page['hours'].get_text(strip=True)}
         return {}
 
-    def _extract_additional_info(self, soup: BeautifulSoup) -> Dict:
+    def _extract_additional_info(self, page: Dict) -> Dict:
         info = {}
-        price_range = soup.find(class_=re.compile(r'price-range|pricing', re.I))
-        if price_range:
-            info['price_range'] = price_range.get_text(strip=True)
-        cuisine = soup.find(class_=re.compile(r'cuisine|food-type', re.I))
-        if cuisine:
-            info['cuisine'] = cuisine.get_text(strip=True)
+        if page['price_range'] is not None:
+            info['price_range'] = page['price_range'].get_text(strip=True)
+        if page['cuisine'] is not None:
+            info['cuisine'] = page['cuisine'].get_text(strip=True)
         return info
 
     def _extract_emails(self, text: str) -> List[str]:
-        emails = re.findall(self.patterns['email'], text)
-        return [email for email in emails if not email.endswith(('.png', '.jpg', '.gif', '.jpeg')) and len(email) < 100]
+        emails = self.EMAIL_PATTERN.findall(text)
+        return [email for email in emails if not email.endswith(self.IMAGE_SUFFIXES) and len(email) < 100]
 
     def _extract_phones(self, text: str) -> List[str]:
-        return re.findall(self.patterns['phone'], text)
+        return self.PHONE_PATTERN.findall(text)
 
     def _get_empty_result(self) -> Dict:
         return {'url': None, 'structured_data': {}, 'meta_data': {}, 'contact_info': {'emails': [], 'phones': [], 'address': None}, 'social_media': {}, 'business_hours': {}, 'additional_info': {}}
 
-# Function to send data to API
-def send_to_api(data, api_endpoint, api_key=None):
+
+class WebsiteEnricher:
+    # Runs WebsiteDataExtractor on a thread pool so the event loop keeps going,
+    # with one pooled session, a global concurrency limit and a per-host limit.
+    def __init__(self, concurrency=WEBSITE_CONCURRENCY, per_host=WEBSITE_PER_HOST):
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="website")
+        self.contact_executor = ThreadPoolExecutor(max_workers=concurrency * 2, thread_name_prefix="website-contact")
+        self.extractor = WebsiteDataExtractor(executor=self.contact_executor, http_cache=get_http_cache())
+        self.extractor.session = self.extractor._create_session(pool_size=concurrency * 3)
+        self.per_host = per_host
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._host_slots = {}  # host -> [semaphore, extractions holding or waiting for it]
+
+    @asynccontextmanager
+    async def _host_slot(self, url):
+        # A host's entry is dropped as soon as no extraction holds or waits for
+        # it, so the long-lived enricher only tracks hosts that are in flight
+        host = urlparse(url if url.startswith(('http://', 'https://')) else 'https://' + url).netloc.lower()
+        slot = self._host_slots.setdefault(host, [asyncio.Semaphore(self.per_host), 0])
+        slot[1] += 1
+        try:
+            async with slot[0]:
+                yield
+        finally:
+            slot[1] -= 1
+            if slot[1] == 0:
+                del self._host_slots[host]
+
+    async def extract(self, url, memo=None):
+        # memo maps url -> extraction task for one run, so places sharing a
+        # website (chains, franchises) trigger a single extraction
+        if not url or url == "N/A" or url == "Null":
+            return self.extractor._get_empty_result()
+        if memo is None:
+            return await self._extract(url)
+        if url not in memo:
+            memo[url] = asyncio.ensure_future(self._extract(url))
+        return await asyncio.shield(memo[url])
+
+    async def _extract(self, url):
+        loop = asyncio.get_running_loop()
+        # Copy the context so progress updates from the worker thread reach this job
+        context = contextvars.copy_context()
+        async with self._semaphore, self._host_slot(url):
+            return await loop.run_in_executor(self.executor, context.run, self.extractor.extract_structured_data, url)
+
+
+_website_enricher = None
+
+
+def get_website_enricher():
+    global _website_enricher
+    if _website_enricher is None:
+        _website_enricher = WebsiteEnricher()
+    return _website_enricher
+
+
+# Function to send data to API, in gzip-compressed batches read from the result files
+def send_to_api(api_endpoint, api_key, search_for, timestamp, csv_filename, json_filename, listings_count):
     if not api_endpoint:
         send_update({"status": "warning", "message": "No API endpoint provided. Skipping API submission."})
         return False
-    
+
     try:
-        headers = {
-            'Content-Type': 'application/json'
-        }
-        
-        if api_key:
-            headers['Authorization'] = f'Bearer {api_key}'
-        
-        send_update({"status": "info", "message": f"Sending data to API"})
-        response = requests.post(api_endpoint, json=data, headers=headers, timeout=30)
-        
-        if response.status_code >= 200 and response.status_code < 300:
-            send_update({"status": "success", "message": f"Data successfully sent to API. Response: {response.status_code}"})
-            return True
-        else:
-            send_update({"status": "error", "message": f"API request failed with status code: {response.status_code}, Response: {response.text}"})
+        delivery = get_api_delivery()
+        batches = (
+            (idempotency_key(api_endpoint, search_for, timestamp, batch), document)
+            for batch, document in iter_api_batches(search_for, timestamp, csv_filename, json_filename, listings_count, API_BATCH_SIZE, CSV_COLUMN_TYPES)
+        )
+        send_update({"status": "info", "message": f"Sending data to API in batches of {API_BATCH_SIZE}"})
+        sent, queued = delivery.deliver(api_endpoint, api_key, batches)
+        if queued:
+            send_update({"status": "error", "message": f"{queued} of {sent + queued} batches could not be delivered and were kept in the outbox for a later replay"})
             return False
-    
+        send_update({"status": "success", "message": f"Data successfully sent to API in {sent} batches"})
+        return True
+
     except Exception as e:
         send_update({"status": "error", "message": f"Error sending data to API: {str(e)}"})
         return False
-    
+
 # def listing_scraper(args):
 #     # Create a new event loop for this thread
 #     loop = asyncio.new_event_loop()
@@ -280,432 +581,240 @@ def send_to_api(data, api_endpoint, api_key=None):
 #         return result
 #     finally:
 #         loop.close()
-async def async_listing_scraper(args, browser):
-    idx, listing_href, len_listings, search_for, timeout_count = args
-    try:
-        page = await browser.new_page()
-        await page.set_viewport_size({"width": 1920, "height": 1080})
-        try:
-            name_xpath = '//div[@class="TIHn2 "]//h1[@class="DUwDvf lfPIob"]'
-            address_xpath = '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]'
-            website_xpath = '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]'
-            phone_number_xpath = '//button[contains(@data-item-id, "phone:tel:")]//div[contains(@class, "fontBodyMedium")]'
-            reviews_count_xpath = '//div[@class="TIHn2 "]//div[@class="fontBodyMedium dmRWX"]//div//span//span//span[@aria-label]'
-            reviews_average_xpath = '//div[@class="TIHn2 "]//div[@class="fontBodyMedium dmRWX"]//div//span[@aria-hidden]'
-            intro_xpath = '//div[@class="WeS02d fontBodyMedium"]//div[@class="PYvSYb "]'
-            info1 = '//div[@class="LTs0Rc"][1]'
-            info2 = '//div[@class="LTs0Rc"][2]'
-            info3 = '//div[@class="LTs0Rc"][3]'
-            opens_at_xpath = '//button[contains(@data-item-id, "oh")]//div[contains(@class, "fontBodyMedium")]'
-            opens_at_xpath2 = '//div[@class="MkV9"]//span[@class="ZDu9vd"]//span[2]'
-            place_type_xpath = '//div[@class="LBgpqf"]//button[@class="DkEaL "]'
-            sort_button= '//button/span/span[contains(text(),"Sort")]'
-            
-            print(args)
-            await page.goto(listing_href, timeout=60000)
-            
-            
-            await page.wait_for_timeout(4000)
-
-            try:
-                await page.wait_for_selector(name_xpath, timeout=60000)
-            except:
-                pass
-            name = await page.locator(name_xpath).inner_text() if await page.locator(name_xpath).count() > 0 else ""
-            
-            address = await page.locator(address_xpath).inner_text() if await page.locator(address_xpath).count() > 0 else ""
-            
-            website = await page.locator(website_xpath).inner_text() if await page.locator(website_xpath).count() > 0 else ""
-            
-            phone = await page.locator(phone_number_xpath).inner_text() if await page.locator(phone_number_xpath).count() > 0 else ""
-            
-            place_type = await page.locator(place_type_xpath).inner_text() if await page.locator(place_type_xpath).count() > 0 else ""
-            
-            introduction = await page.locator(intro_xpath).inner_text() if await page.locator(intro_xpath).count() > 0 else "None Found"
-
-            reviews_count = 0
-            if await page.locator(reviews_count_xpath).count() > 0:
-                temp = await page.locator(reviews_count_xpath).inner_text()
-                temp = temp.replace('(', '').replace(')', '').replace(',', '')
-                reviews_count = int(temp)
-
-            reviews_average = 0.0
-            if await page.locator(reviews_average_xpath).count() > 0:
-                temp = await page.locator(reviews_average_xpath).inner_text()
-                temp = temp.replace(' ', '').replace(',', '.')
-                reviews_average = float(temp)
-
-            store_shopping = "No"
-            in_store_pickup = "No"
-            store_delivery = "No"
-
-            if await page.locator(info1).count() > 0:
-                temp = await page.locator(info1).inner_text()
-                temp = temp.split('·')
-                if len(temp) > 1:
-                    check = temp[1].replace("\n", "")
-                    if 'shop' in check.lower():
-                        store_shopping = "Yes"
-                    elif 'pickup' in check.lower():
-                        in_store_pickup = "Yes"
-                    elif 'delivery' in check.lower():
-                        store_delivery = "Yes"
-
-            if await page.locator(info2).count() > 0:
-                temp = await page.locator(info2).inner_text()
-                temp = temp.split('·')
-                if len(temp) > 1:
-                    check = temp[1].replace("\n", "")
-                    if 'pickup' in check.lower():
-                        in_store_pickup = "Yes"
-                    elif 'shop' in check.lower():
-                        store_shopping = "Yes"
-                    elif 'delivery' in check.lower():
-                        store_delivery = "Yes"
-
-            if await page.locator(info3).count() > 0:
-                temp = await page.locator(info3).inner_text()
-                temp = temp.split('·')
-                if len(temp) > 1:
-                    check = temp[1].replace("\n", "")
-                    if 'delivery' in check.lower():
-                        store_delivery = "Yes"
-                    elif 'pickup' in check.lower():
-                        in_store_pickup = "Yes"
-                    elif 'shop' in check.lower():
-                        store_shopping = "Yes"
-
-            opens_at = ""
-            if await page.locator(opens_at_xpath).count() > 0:
-                opens = await page.locator(opens_at_xpath).inner_text()
-                opens = opens.split('⋅')
-                if len(opens) != 1:
-                    opens = opens[1]
-                opens = opens.replace("\u202f", "")
-                opens_at = opens
-            else:
-                if await page.locator(opens_at_xpath2).count() > 0:
-                    opens = await page.locator(opens_at_xpath2).inner_text()
-                    opens = opens.split('⋅')
-                    opens = opens[1]
-                    opens = opens.replace("\u202f", "")
-                    opens_at = opens
-
-            overview_xpath= '//button[contains(@aria-label,"Overview ")]'
-            try:
-                await page.wait_for_selector(overview_xpath, timeout=60000)
-            except:
-                pass
-            await page.locator(overview_xpath).click()
-
-            await page.mouse.wheel(0, 10000)
-            await asyncio.sleep(1)
-            
-            await page.mouse.wheel(0, 10000)
-            await asyncio.sleep(1)
-
-            iframe = page.frame_locator("//iframe[@class='rvN3ke']")
-
-            map_insta= "N/A"
-            map_facebook= "N/A"
-            for links_div in await iframe.locator('//div[@role="heading"]/parent::g-card-section/parent::div/parent::div').all():
-                async with page.expect_popup() as popup_info:  # Wait for new tab
-                    await links_div.click()
-                new_tab = await popup_info.value  
+PLACE_ANCHOR_SELECTOR = 'a[href*="https://www.google.com/maps/place"]'
+HARVESTED_ATTRIBUTE = 'data-gms-harvested'
+
+# Resolves as soon as the results feed holds place links that have not been
+# harvested yet, or Google renders the "You've reached the end of the list" marker.
+FEED_GROWTH_JS = f"""
+() => {{
+    if (document.querySelector('{PLACE_ANCHOR_SELECTOR}:not([{HARVESTED_ATTRIBUTE}])')) return "grew";
+    if (document.querySelector('span.HlvSq')) return "end";
+    return false;
+}}
+"""
+
+# Returns the hrefs of place links added since the previous call and tags them
+# so that the next call only sees anchors appended by further scrolling.
+HARVEST_NEW_HREFS_JS = f"""
+() => {{
+    const hrefs = [];
+    for (const anchor of document.querySelectorAll('{PLACE_ANCHOR_SELECTOR}:not([{HARVESTED_ATTRIBUTE}])')) {{
+        anchor.setAttribute('{HARVESTED_ATTRIBUTE}', '1');
+        if (anchor.href) hrefs.push(anchor.href);
+    }}
+    return hrefs;
+}}
+"""
+
+PLACE_ID_PATTERNS = [
+    re.compile(r'!19s(ChIJ[^!?&]+)'),
+    re.compile(r'!1s(0x[0-9a-fA-F]+:0x[0-9a-fA-F]+)'),
+]
+
+
+def extract_place_id(href):
+    for pattern in PLACE_ID_PATTERNS:
+        match = pattern.search(href)
+        if match:
+            return match.group(1)
+    return href.split('?')[0]
+
+
+class ListingHarvester:
+    def __init__(self, limit, on_new_href=None, accept=None):
+        self.limit = limit
+        self.on_new_href = on_new_href
+        self.accept = accept  # place ID -> False to skip a place other jobs already cover
+        self.hrefs = {}  # place ID -> href, in discovery order
+        self.skipped = set()
+
+    @property
+    def listing_hrefs(self):
+        return list(self.hrefs.values())
+
+    def is_full(self):
+        return len(self.hrefs) >= self.limit
+
+    async def harvest(self, page):
+        new_hrefs = []
+        for href in await page.evaluate(HARVEST_NEW_HREFS_JS):
+            if self.is_full():
+                break
+            place_id = extract_place_id(href)
+            if place_id in self.hrefs or place_id in self.skipped:
+                continue
+            if self.accept and not self.accept(place_id):
+                self.skipped.add(place_id)
+                continue
+            self.hrefs[place_id] = href
+            new_hrefs.append(href)
+            if self.on_new_href:
+                await self.on_new_href(place_id, href)
+        return new_hrefs
 
-                if len(new_tab.url.split("/"))==5:
-                    if new_tab.url.startswith("https://www.instagram.com/"):
-                        map_insta= new_tab.url
-                    if new_tab.url.startswith("https://www.facebook.com/"):
-                        map_facebook= new_tab.url
-                
-                print("Opened URL:", new_tab.url, len(new_tab.url.split("/"))) 
 
-                await new_tab.close() 
+async def wait_for_feed_growth(page, idle_timeout):
+    try:
+        handle = await page.wait_for_function(FEED_GROWTH_JS, timeout=idle_timeout, polling=250)
+        return await handle.json_value()
+    except PlaywrightTimeoutError:
+        return "idle"
+
+
+# Place page fields read by extract_listing_fields, by XPath
+LISTING_FIELD_XPATHS = {
+    'name': '//div[@class="TIHn2 "]//h1[@class="DUwDvf lfPIob"]',
+    'address': '//button[@data-item-id="address"]//div[contains(@class, "fontBodyMedium")]',
+    'website': '//a[@data-item-id="authority"]//div[contains(@class, "fontBodyMedium")]',
+    'phone': '//button[contains(@data-item-id, "phone:tel:")]//div[contains(@class, "fontBodyMedium")]',
+    'place_type': '//div[@class="LBgpqf"]//button[@class="DkEaL "]',
+    'introduction': '//div[@class="WeS02d fontBodyMedium"]//div[@class="PYvSYb "]',
+    'reviews_count': '//div[@class="TIHn2 "]//div[@class="fontBodyMedium dmRWX"]//div//span//span//span[@aria-label]',
+    'reviews_average': '//div[@class="TIHn2 "]//div[@class="fontBodyMedium dmRWX"]//div//span[@aria-hidden]',
+    'info1': '//div[@class="LTs0Rc"][1]',
+    'info2': '//div[@class="LTs0Rc"][2]',
+    'info3': '//div[@class="LTs0Rc"][3]',
+    'opens_at': '//button[contains(@data-item-id, "oh")]//div[contains(@class, "fontBodyMedium")]',
+    'opens_at_fallback': '//div[@class="MkV9"]//span[@class="ZDu9vd"]//span[2]',
+}
+
+# Service keywords checked against each LTs0Rc info row, in priority order
+INFO_ROW_KEYWORDS = {
+    'info1': ('shop', 'pickup', 'delivery'),
+    'info2': ('pickup', 'shop', 'delivery'),
+    'info3': ('delivery', 'pickup', 'shop'),
+}
+
+# Evaluates every XPath of the table in one call and returns the inner text of
+# the first match for each field, or null when the field is missing.
+EXTRACT_FIELDS_JS = """
+(xpaths) => {
+    const fields = {};
+    for (const [field, xpath] of Object.entries(xpaths)) {
+        const node = document.evaluate(xpath, document, null, XPathResult.FIRST_ORDERED_NODE_TYPE, null).singleNodeValue;
+        fields[field] = node ? node.innerText : null;
+    }
+    return fields;
+}
+"""
 
-            print('insta on map: ',map_insta)
 
-            print('Facebook on map: ',map_facebook)
+async def extract_listing_fields(page, xpaths=LISTING_FIELD_XPATHS):
+    return await page.evaluate(EXTRACT_FIELDS_JS, xpaths)
 
-            negative_reviews= []
-            Positive_reviews= []
-            
-            try:
-                await page.wait_for_selector(sort_button, timeout=60000)
-            except:
-                pass
-            await page.locator(sort_button).click()
 
-            await asyncio.sleep(1)
-            
-            await page.keyboard.press("ArrowDown")
-            await asyncio.sleep(0.3)
-            await page.keyboard.press("ArrowDown")
-            await asyncio.sleep(0.3)
-            await page.keyboard.press("ArrowDown")
-            await asyncio.sleep(0.3)
-            await page.keyboard.press("Enter")
-            await asyncio.sleep(2)
-            
-            await page.mouse.wheel(0, 10000)
-            await asyncio.sleep(1)
+class ConsentWallError(Exception):
+    pass
 
-            more_buttons_xpath = '//button[contains(text(), "More")]'
-            more_buttons = await page.locator(more_buttons_xpath).all()
 
-            for index, button in enumerate(more_buttons):
-                try:
-                    if await button.is_visible():  # Click only if the button is visible
-                        # print(f"Clicking 'More' button {index + 1}")
-                        await button.click(timeout=50000)  # Set a lower timeout
-                        await asyncio.sleep(2)  # Let content expand
-                except Exception as e:
-                    print(f"Error clicking 'More' button {index + 1}: {e}")
+async def async_listing_scraper(args, pool, resource_policy=None, limiter=None, field_groups=None):
+    idx, listing_href, len_listings, search_for, timeout_count = args
+    field_groups = field_groups or list(FIELD_GROUPS)
+    async with pool.page(resource_policy=resource_policy) as page:
+        started = time.monotonic()
+        try:
+            print(args)
+            await page.goto(listing_href, timeout=60000)
+            if page.url.startswith('https://consent.google.com'):
+                raise ConsentWallError(f"Redirected to consent page {page.url}")
             
-            # Xpath for reviews
-            reviews_xpath = '//div[contains(@class, "MyEned")]/span'  # Adjust based on actual HTML structure
             
+            await page.wait_for_timeout(4000)
 
-            # Extract all reviews
-            reviews_locators = await page.locator(reviews_xpath).all()
-            reviews = []
-            for review_locator in reviews_locators:
-                reviews.append(await review_locator.inner_text())
-
-            # Print or store reviews
-            unique_reviews= []
-
-            for review_ in reviews:
-                if review_ not in unique_reviews:
-                    if review_ != " More":
-                        unique_reviews.append(review_)
-
-            if len(unique_reviews)>5:
-                negative_reviews= unique_reviews[:5]
-            else:
-                negative_reviews= unique_reviews
-            
-            
             try:
-                await page.wait_for_selector(sort_button, timeout=60000)
+                await page.wait_for_selector(LISTING_FIELD_XPATHS['name'], timeout=60000)
             except:
                 pass
+            fields = await extract_listing_fields(page)
 
-            await page.locator(sort_button).click()
-
-            await asyncio.sleep(1)
-            
-            await page.keyboard.press("ArrowDown")
-            await asyncio.sleep(0.3)
-            await page.keyboard.press("ArrowDown")
-            await asyncio.sleep(0.3)
-            await page.keyboard.press("Enter")
-            await asyncio.sleep(3)
-            
-            await page.mouse.wheel(0, 10000)
-            await asyncio.sleep(1)
-
-            more_buttons = await page.locator(more_buttons_xpath).all()
-
-            for index, button in enumerate(more_buttons):
-                try:
-                    if await button.is_visible():  # Click only if the button is visible
-                        # print(f"Clicking 'More' button {index + 1}")
-                        await button.click(timeout=0)  # Set a lower timeout
-                        await asyncio.sleep(1)  # Let content expand
-                except Exception as e:
-                    print(f"Error clicking 'More' button {index + 1}: {e}")
-                    
-            # Xpath for reviews
-
-            # Extract all reviews
-            reviews_locators = await page.locator(reviews_xpath).all()
-            reviews = []
-            for review_locator in reviews_locators:
-                reviews.append(await review_locator.inner_text())
-
-            # Print or store reviews
-            unique_reviews= []
-
-            for review_ in reviews:
-                if review_ not in unique_reviews:
-                    if review_ != " More":
-                        unique_reviews.append(review_)
-
-            if len(unique_reviews)>5:
-                Positive_reviews= unique_reviews[:5]
-            else:
-                Positive_reviews= unique_reviews
-
-            if len(negative_reviews) == 0 or len(Positive_reviews) == 0:
-                
-                await page.locator(sort_button).click()
-
-                await asyncio.sleep(2)
-                
-                await page.keyboard.press("ArrowDown")
-                await asyncio.sleep(0.3)
-                await page.keyboard.press("ArrowDown")
-                await asyncio.sleep(0.3)
-                await page.keyboard.press("ArrowDown")
-                await asyncio.sleep(0.3)
-                await page.keyboard.press("Enter")
-                await asyncio.sleep(2)
-                
-                await page.mouse.wheel(0, 10000)
-                await asyncio.sleep(1)
+            name = fields['name'] or ""
+            address = fields['address'] or ""
+            website = fields['website'] or ""
+            phone = fields['phone'] or ""
+            place_type = fields['place_type'] or ""
+            introduction = fields['introduction'] or "None Found"
 
-                more_buttons = await page.locator(more_buttons_xpath).all()
+            reviews_count = 0
+            if fields['reviews_count']:
+                reviews_count = int(fields['reviews_count'].replace('(', '').replace(')', '').replace(',', ''))
 
-                for index, button in enumerate(more_buttons):
-                    try:
-                        if await button.is_visible():  # Click only if the button is visible
-                            # print(f"Clicking 'More' button {index + 1}")
-                            await button.click(timeout=50000)  # Set a lower timeout
-                            await asyncio.sleep(1)  # Let content expand
-                    except Exception as e:
-                        print(f"Error clicking 'More' button {index + 1}: {e}")
-                
-                # Xpath for reviews
-                
-
-                # Extract all reviews
-                reviews_locators = await page.locator(reviews_xpath).all()
-                reviews = []
-                for review_locator in reviews_locators:
-                    reviews.append(await review_locator.inner_text())
-
-                # Print or store reviews
-                unique_reviews= []
-
-                for review_ in reviews:
-                    if review_ not in unique_reviews:
-                        if review_ != " More":
-                            unique_reviews.append(review_)
-
-                if len(unique_reviews)>5:
-                    negative_reviews= unique_reviews[:5]
-                else:
-                    negative_reviews= unique_reviews
+            reviews_average = 0.0
+            if fields['reviews_average']:
+                reviews_average = float(fields['reviews_average'].replace(' ', '').replace(',', '.'))
+
+            services = {'shop': "No", 'pickup': "No", 'delivery': "No"}
+            for field, keywords in INFO_ROW_KEYWORDS.items():
+                if fields[field]:
+                    temp = fields[field].split('·')
+                    if len(temp) > 1:
+                        check = temp[1].replace("\n", "").lower()
+                        for keyword in keywords:
+                            if keyword in check:
+                                services[keyword] = "Yes"
+                                break
+            store_shopping = services['shop']
+            in_store_pickup = services['pickup']
+            store_delivery = services['delivery']
 
+            opens_at = ""
+            opens = fields['opens_at'] or fields['opens_at_fallback']
+            if opens:
+                opens = opens.split('⋅')
+                opens = opens[1] if len(opens) > 1 else opens[0]
+                opens_at = opens.replace("\u202f", "")
 
+            # Groups the job did not ask for are skipped along with their clicks and waits
+            if 'socials' in field_groups or 'reviews' in field_groups:
+                overview_xpath= '//button[contains(@aria-label,"Overview ")]'
                 try:
-                    await page.wait_for_selector(sort_button, timeout=60000)
+                    await page.wait_for_selector(overview_xpath, timeout=60000)
                 except:
                     pass
+                await page.locator(overview_xpath).click()
 
-                await page.locator(sort_button).click()
-
-                await asyncio.sleep(1)
-                
-                await page.keyboard.press("ArrowDown")
-                await asyncio.sleep(0.3)
-                await page.keyboard.press("ArrowDown")
-                await asyncio.sleep(0.3)
-                await page.keyboard.press("Enter")
+                await page.mouse.wheel(0, 10000)
                 await asyncio.sleep(1)
-                
+            
                 await page.mouse.wheel(0, 10000)
-                await asyncio.sleep(2)
-
-                more_buttons = await page.locator(more_buttons_xpath).all()
-
-                for index, button in enumerate(more_buttons):
-                    try:
-                        if await button.is_visible():  # Click only if the button is visible
-                            # print(f"Clicking 'More' button {index + 1}")
-                            await button.click(timeout=50000)  # Set a lower timeout
-                            await asyncio.sleep(1)  # Let content expand
-                    except Exception as e:
-                        print(f"Error clicking 'More' button {index + 1}: {e}")
-                
-                # Xpath for reviews
-                try:
-                    await page.wait_for_selector(reviews_xpath, timeout=60000)
-                except:
-                    pass
+                await asyncio.sleep(1)
 
-                # Extract all reviews
-                reviews_locators = await page.locator(reviews_xpath).all()
-                reviews = []
-                for review_locator in reviews_locators:
-                    reviews.append(await review_locator.inner_text())
+            map_insta= "N/A"
+            map_facebook= "N/A"
+            if 'socials' in field_groups:
+                map_facebook, map_insta = await resolve_map_socials(page)
 
-                # Print or store reviews
-                unique_reviews= []
+                print('insta on map: ',map_insta)
 
-                for review_ in reviews:
-                    if review_ not in unique_reviews:
-                        if review_ != " More":
-                            unique_reviews.append(review_)
+                print('Facebook on map: ',map_facebook)
 
-                if len(unique_reviews)>5:
-                    Positive_reviews= unique_reviews[:5]
-                else:
-                    Positive_reviews= unique_reviews
+            negative_reviews, positive_reviews = [], []
+            if 'reviews' in field_groups:
+                negative_reviews, positive_reviews = await collect_review_sets(page)
 
-            print("\n\nnegative_reviews:",negative_reviews, "\n\nPositive_reviews:",Positive_reviews)
+                print("\n\nnegative_reviews:", [(review['rating'], review['text']) for review in negative_reviews],
+                      "\n\nPositive_reviews:", [(review['rating'], review['text']) for review in positive_reviews])
 
             atmosphere= []
-            try: 
-                about_xpath= '//button[contains(@aria-label,"About ")]'
-                try:
-                    await page.wait_for_selector(about_xpath, timeout=60000)
-                except:
-                    pass
-                await page.locator(about_xpath).click()
-                await asyncio.sleep(1)
-                atmosphere_xpath= '//h2/parent::div/ul/li/div/span[2]'
-                try:
-                    await page.wait_for_selector(atmosphere_xpath, timeout=60000)
+            if 'atmosphere' in field_groups:
+                try: 
+                    about_xpath= '//button[contains(@aria-label,"About ")]'
+                    try:
+                        await page.wait_for_selector(about_xpath, timeout=60000)
+                    except:
+                        pass
+                    await page.locator(about_xpath).click()
+                    await asyncio.sleep(1)
+                    atmosphere_xpath= '//h2/parent::div/ul/li/div/span[2]'
+                    try:
+                        await page.wait_for_selector(atmosphere_xpath, timeout=60000)
+                    except:
+                        pass
+                    atmosphere_elements= await page.locator(atmosphere_xpath).all()
+                    for atmosphere_element in atmosphere_elements:
+                        atmosphere.append(await atmosphere_element.inner_text())
                 except:
                     pass
-                atmosphere_elements= await page.locator(atmosphere_xpath).all()
-                for atmosphere_element in atmosphere_elements:
-                    atmosphere.append(await atmosphere_element.inner_text())
-            except:
-                pass
-
-            try:
-                Positive_review_1= Positive_reviews[0]
-            except:
-                Positive_review_1= "N/A"
-            try:
-                Positive_review_2= Positive_reviews[1]
-            except:
-                Positive_review_2= "N/A"
-            try:
-                Positive_review_3= Positive_reviews[2]
-            except:
-                Positive_review_3= "N/A"
-            try:
-                Positive_review_4= Positive_reviews[3]
-            except:
-                Positive_review_4= "N/A"
-            try:
-                Positive_review_5= Positive_reviews[4]
-            except:
-                Positive_review_5= "N/A"
-            try:
-                Negative_review_1= negative_reviews[0]
-            except:
-                Negative_review_1= "N/A"
-            try:
-                Negative_review_2= negative_reviews[1]
-            except:
-                Negative_review_2= "N/A"
-            try:
-                Negative_review_3= negative_reviews[2]
-            except:
-                Negative_review_3= "N/A"
-            try:
-                Negative_review_4= negative_reviews[3]
-            except:
-                Negative_review_4= "N/A"
-            try:
-                Negative_review_5= negative_reviews[4]
-            except:
-                Negative_review_5= "N/A"
 
             listing_data= {
                 'Names': name,
@@ -720,28 +829,27 @@ async def async_listing_scraper(args, browser):
                 'Delivery': store_delivery,
                 'Type': place_type,
                 'Opens At': opens_at,
-                'Negative Review 1': Negative_review_1,
-                'Negative Review 2': Negative_review_2,
-                'Negative Review 3': Negative_review_3,
-                'Negative Review 4': Negative_review_4,
-                'Negative Review 5': Negative_review_5,
-                'Positive Review 1': Positive_review_1,
-                'Positive Review 2': Positive_review_2,
-                'Positive Review 3': Positive_review_3,
-                'Positive Review 4': Positive_review_4,
-                'Positive Review 5': Positive_review_5,
+                **review_columns(negative_reviews, positive_reviews),
                 'Atmosphere': str(atmosphere)[1:-1],
                 'Map Facebook': str(map_facebook),
-                'Map Instagram': str(map_insta)
+                'Map Instagram': str(map_insta),
+                **skipped_fields(field_groups)
             }
 
-            send_update({"status": "progress", "message": f"Processed listing {idx+1}/{len_listings}: {name}", "total": len_listings, "current": idx+1})
+            update = {"status": "progress", "message": f"Processed listing {idx+1}/{len_listings}: {name}", "total": len_listings, "current": idx+1}
+            if limiter:
+                limiter.record(time.monotonic() - started, 'ok')
+                update['concurrency'] = limiter.limit
+            send_update(update)
             await page.wait_for_timeout(1000)
             return listing_data
         except Exception as e:
+            if limiter:
+                outcome = 'consent' if isinstance(e, ConsentWallError) else 'timeout' if isinstance(e, PlaywrightTimeoutError) else 'error'
+                limiter.record(time.monotonic() - started, outcome)
             # if "Timeout" in str(e) and timeout_count<20:
             #     timeout_count= timeout_count+1
-            #     return await async_listing_scraper(args, browser)
+            #     return await async_listing_scraper(args, pool)
 
             exc_type, exc_obj, exc_tb = traceback.sys.exc_info()
             
@@ -762,277 +870,508 @@ async def async_listing_scraper(args, browser):
                 'Delivery': "No",
                 'Type': "Null",
                 'Opens At': "Null",
-                'Negative Review 1': "Null",
-                'Negative Review 2': "Null",
-                'Negative Review 3': "Null",
-                'Negative Review 4': "Null",
-                'Negative Review 5': "Null",
-                'Positive Review 1': "Null",
-                'Positive Review 2': "Null",
-                'Positive Review 3': "Null",
-                'Positive Review 4': "Null",
-                'Positive Review 5': "Null",
+                **review_columns([], [], missing="Null"),
                 'Atmosphere': "Null",
                 'Map Facebook': "Null",
                 'Map Instagram': "Null"
             }
         
-    finally:
-        await page.close()
-        
         
-async def run_scraper(search_for, total, api_endpoint=None, api_key=None):
-    send_update({"status": "info", "message": f"Starting scraper for '{search_for}' with {total} results"})
-    timeout_count = 0
-    async with async_playwright() as p:
+async def run_stage(in_queue, out_queue, handler, workers):
+    # Each worker forwards handler results downstream until it sees the None
+    # sentinel, which it puts back so its siblings stop as well.
+    async def worker():
+        while True:
+            item = await in_queue.get()
+            if item is None or is_cancelled():
+                await in_queue.put(None)
+                break
+            try:
+                result = await handler(item)
+            except Exception as e:
+                send_update({"status": "error", "message": f"Pipeline error: {str(e)}"})
+                continue
+            if result is not None and out_queue is not None:
+                await out_queue.put(result)
+
+    try:
+        await asyncio.gather(*[worker() for _ in range(workers)])
+    finally:
+        if out_queue is not None:
+            await out_queue.put(None)
+
+
+async def run_adaptive_stage(in_queue, out_queue, handler, limiter):
+    # Takes the next item off the queue only once the limiter has a free slot,
+    # so work is fed lazily at whatever parallelism the limiter currently allows.
+    tasks = set()
+
+    async def run(item):
         try:
-            browser = await p.chromium.launch(headless=True)
-            page = await browser.new_page()
-            await page.set_viewport_size({"width": 1920, "height": 1080})
+            result = await handler(item)
+            if result is not None and out_queue is not None:
+                await out_queue.put(result)
+        except Exception as e:
+            send_update({"status": "error", "message": f"Pipeline error: {str(e)}"})
+        finally:
+            await limiter.release()
+
+    try:
+        while True:
+            await limiter.acquire()
+            item = await in_queue.get()
+            if item is None or is_cancelled():
+                await limiter.release()
+                break
+            task = asyncio.ensure_future(run(item))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+    finally:
+        # Only left over when the stage itself was cancelled or failed
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if out_queue is not None:
+            await out_queue.put(None)
+
+
+async def run_pipeline(*stages):
+    # Like gather, but a stage that fails cancels the others and waits for
+    # them, so no stage outlives the job or writes to closed output files
+    tasks = [asyncio.ensure_future(stage) for stage in stages]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+def extract_address_components(address):
+    if not address:
+        return None, None, None, None
+    parts = address.split(', ')
+    street = parts[0] if parts else None
+    city = parts[1] if len(parts) > 1 else None
+    state = parts[2].split(' ')[0] if len(parts) > 2 else None
+    postal_code = parts[2].split(' ')[1] if len(parts) > 2 and len(parts[2].split(' ')) > 1 else None
+    return street, city, state, postal_code
+
+
+# Email Validation and Cleaning
+def clean_email(email):
+    if pd.isna(email) or email == 'N/A':
+        return 'N/A'
+    email = email.lower()
+    cleaned_email = re.sub(r'[^a-z@.]', '', email)
+    return cleaned_email
+
+
+def facebook_links(website_data):
+    return [link for link in build_website_columns(website_data)['Facebook'].split(', ') if link != 'N/A']
+
+
+def build_website_columns(data):
+    social_media = data['social_media']
+    return {
+        'Email': data['contact_info']['emails'][0] if data['contact_info']['emails'] else 'N/A',
+        'Additional_Phones': ', '.join(data['contact_info']['phones']) if data['contact_info']['phones'] else 'N/A',
+        'Facebook': ', '.join(social_media.get('facebook', [])) if social_media.get('facebook') else 'N/A',
+        'Instagram': ', '.join(social_media.get('instagram', [])) if social_media.get('instagram') else 'N/A',
+        'Twitter': ', '.join(social_media.get('twitter', [])) if social_media.get('twitter') else 'N/A',
+        'Linkedin': ', '.join(social_media.get('linkedin', [])) if social_media.get('linkedin') else 'N/A',
+        'Youtube': ', '.join(social_media.get('youtube', [])) if social_media.get('youtube') else 'N/A',
+        'Business_Hours': str(data['business_hours']) if data['business_hours'] else 'N/A',
+    }
 
-            send_update({"status": "info", "message": "Navigating to Google Maps..."})
-            await page.goto("https://www.google.com/maps", timeout=60000)
-            await page.wait_for_timeout(3000)
 
-            send_update({"status": "info", "message": f"Searching for '{search_for}'..."})
-            
-            await page.wait_for_selector('//input[@id="searchboxinput"]', timeout=60000)
-            search_box = page.locator('//input[@id="searchboxinput"]')
-            await search_box.click()
-            await search_box.fill(search_for)
-            await page.keyboard.press("Enter")
+# Fixed CSV schema, so every run's file has the same columns in the same order
+CSV_COLUMNS = [key for keys in FIELD_GROUPS.values() for key in keys] + [
+    'Email', 'Additional_Phones', 'Facebook', 'Instagram', 'Twitter', 'Linkedin', 'Youtube', 'Business_Hours',
+    'email_1', 'Facebook Intro', 'Street', 'City', 'State', 'Postal Code', 'search_query',
+]
+# Non-text CSV columns, restored when the API rows are read back from the CSV
+CSV_COLUMN_TYPES = {'Review Count': int, 'Average Review Count': float}
 
-            await page.wait_for_selector('//a[contains(@href, "https://www.google.com/maps/place")]', timeout=60000)
-            await page.hover('//a[contains(@href, "https://www.google.com/maps/place")]')
 
-            listings = []
-            last_height = 0
+def build_csv_row(record, search_for):
+    row = {**record['listing'], **build_website_columns(record['website_data']), **record['facebook']}
+    street, city, state, postal_code = extract_address_components(row.get('Address'))
+    row.update({'Street': street, 'City': city, 'State': state, 'Postal Code': postal_code})
+    row['search_query'] = f"{search_for.split('in')[0].strip()}, {postal_code}, {city}, {state}, US"
+    row['Email'] = clean_email(row['Email'])
+    row['email_1'] = clean_email(row['email_1'])
+    return row
 
-            send_update({"status": "info", "message": "Scrolling to find listings..."})
-            while len(listings) < total:
-                await page.mouse.wheel(0, 10000)
-                await page.wait_for_selector('//a[contains(@href, "https://www.google.com/maps/place")]')
-                await page.wait_for_timeout(50000)  # Wait for content to load
-
-                new_listings = await page.locator('//a[contains(@href, "https://www.google.com/maps/place")]').all()
-                new_listings = [listing.locator("xpath=..") for listing in new_listings]
-                if len(new_listings) > len(listings):
-                    listings = new_listings
-                    send_update({"status": "progress", "message": f"Found {len(listings)} listings", "total": total, "current": len(listings)})
-                else:
-                    current_height = await page.evaluate("window.scrollY")
-                    if current_height == last_height:
-                        send_update({"status": "info", "message": f"No new results found, stopping scroll. Found {len(listings)} results."})
-                        break
-                    last_height = current_height
 
-            listings = listings[:total]
+def build_detailed_record(record):
+    listing = record['listing']
+    detailed = dict(record['website_data'])
+    detailed['reviews'] = {
+        'negative_reviews': [listing.get(f'Negative Review {i}', 'N/A') for i in range(1, REVIEWS_PER_SORT + 1)],
+        'positive_reviews': [listing.get(f'Positive Review {i}', 'N/A') for i in range(1, REVIEWS_PER_SORT + 1)]
+    }
+    detailed['atmosphere'] = listing.get('Atmosphere', 'N/A')
+    detailed['map_social_media'] = {
+        'facebook': listing.get('Map Facebook', 'N/A'),
+        'instagram': listing.get('Map Instagram', 'N/A')
+    }
+    return detailed
+
+
+FACEBOOK_INTRO_XPATH = '//div[@class="xieb3on"]/div/div/div/span'
+FACEBOOK_EMAIL_PATTERN = re.compile(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}')
+
+# Text of the nodes a page's email can appear in: mailto links and the intro
+# section, falling back to the main column's text when neither is present.
+FACEBOOK_EMAIL_SOURCES_JS = """
+() => {
+    const texts = Array.from(document.querySelectorAll('a[href^="mailto:"]')).map(anchor => anchor.getAttribute('href').slice(7));
+    for (const node of document.querySelectorAll('div.xieb3on')) texts.push(node.innerText);
+    if (texts.length === 0) {
+        const main = document.querySelector('div[role="main"]');
+        if (main) texts.push(main.innerText);
+    }
+    return texts.join('\\n');
+}
+"""
+
+
+class FacebookPagePool:
+    # Hands a released page to the next queued record with Facebook links,
+    # instead of opening a new page for it. A page is only kept while such a
+    # record is waiting for one and goes back to the browser pool otherwise,
+    # so it never holds a slot that place detail workers are waiting for.
+    def __init__(self, pool):
+        self.pool = pool
+        self.waiting = 0  # queued records with Facebook links that have no page yet
+        self._idle = []
+        self._leases = {}
+
+    def expect(self):
+        self.waiting += 1
+
+    async def acquire(self):
+        self.waiting -= 1
+        if self._idle:
+            return self._idle.pop()
+        lease = AsyncExitStack()
+        page = await lease.enter_async_context(self.pool.page())
+        self._leases[page] = lease
+        return page
+
+    async def release(self, page):
+        if len(self._idle) < self.waiting and not page.is_closed():
+            self._idle.append(page)
+        else:
+            await self._leases.pop(page).aclose()
+
+    async def close(self):
+        while self._idle:
+            await self._leases.pop(self._idle.pop()).aclose()
+
+
+async def scrape_facebook_page(temp_page, link, record):
+    await temp_page.goto(link, timeout=60000)
+    try:
+        await temp_page.wait_for_selector(FACEBOOK_INTRO_XPATH, timeout=FACEBOOK_WAIT_TIMEOUT)
+    except PlaywrightTimeoutError:
+        pass
+
+    if await temp_page.locator('div[role="dialog"]').count() > 0:
+        try:
+            close_button = temp_page.locator('div[role="dialog"] button[aria-label="Close"]')
+            if await close_button.count() > 0:
+                await close_button.hover()
+                await close_button.click()
+                await temp_page.locator('div[role="dialog"]').first.wait_for(state="hidden", timeout=FACEBOOK_WAIT_TIMEOUT)
+        except Exception as popup_error:
+            send_update({"status": "error", "message": f"Error closing popup on {link}: {popup_error}"})
+
+    try:
+        record['facebook']['Facebook Intro'] = await temp_page.locator(FACEBOOK_INTRO_XPATH).first.inner_text(timeout=1000)
+    except:
+        record['facebook']['Facebook Intro'] = "N/A"
+
+    try:
+        emails = FACEBOOK_EMAIL_PATTERN.findall(await temp_page.evaluate(FACEBOOK_EMAIL_SOURCES_JS))
+        if emails:
+            record['facebook']['email_1'] = emails[0]
+        else:
+            send_update({"status": "warning", "message": f"No email found on {link}"})
+    except Exception as re_error:
+        send_update({"status": "error", "message": f"Error finding emails on {link}: {re_error}"})
+
+
+async def run_scraper(search_for, total, api_endpoint=None, api_key=None, scroll_idle_timeout=None, pool=None, journal=None, sweep=None, field_groups=None):
+    pool = pool or get_browser_pool()
+    scroll_idle_timeout = scroll_idle_timeout or SCROLL_IDLE_TIMEOUT
+    field_groups = field_groups or list(FIELD_GROUPS)
+    send_update({"status": "info", "message": f"Starting scraper for '{search_for}' with {total} results ({', '.join(field_groups)})"})
+    timeout_count = 0
+    try:
+        # Discovery, place details, website enrichment and Facebook enrichment
+        # run concurrently, connected by queues, so each place moves on to the
+        # next stage as soon as the previous one is done with it.
+        detail_queue = asyncio.Queue()
+        website_queue = asyncio.Queue()
+        facebook_queue = asyncio.Queue()
+        facebook_pages = FacebookPagePool(pool)
+        website_enricher = get_website_enricher()
+        website_memo = {}
+        counters = {'places': 0, 'websites': 0, 'facebook': 0, 'cached': 0, 'failed': 0}
+        place_cache = get_place_cache()
+        place_index = get_place_index()
+        # The sweep and the cross-job index share claim/complete/release semantics
+        claimers = [claimer for claimer in (sweep, place_index) if claimer is not None]
+        job = current_job.get()
+        job_id = job.id if job else None
+        resource_policy = ResourcePolicy.from_env()
+        detail_limiter = AdaptiveLimiter(DETAIL_WORKERS, on_change=lambda limit, previous: send_update(
+            {"status": "info", "message": f"Detail concurrency {'raised' if limit > previous else 'lowered'} to {limit}", "concurrency": limit}
+        ))
+
+        def checkpoint(entry_type, **fields):
+            if journal:
+                journal.append(entry_type, **fields)
+
+        async def enqueue_href(place_id, href):
+            idx = len(harvester.hrefs) - 1
+            checkpoint('href', idx=idx, place_id=place_id, href=href)
+            await detail_queue.put((idx, place_id, href))
+
+        # Duplicates are dropped by place ID as soon as they are harvested, so
+        # they never reach the detail and enrichment stages
+        def accept_place(place_id):
+            for i, claimer in enumerate(claimers):
+                if not claimer.claim(place_id, job_id):
+                    for earlier in claimers[:i]:
+                        earlier.release(job_id, place_id)
+                    return False
+            return True
 
-            send_update({"status": "info", "message": "Extracting basic data from listings..."})
+        harvester = ListingHarvester(total, on_new_href=enqueue_href, accept=accept_place)
+
+        # Places are written out as they finish instead of being collected until the end
+        timestamp = time.strftime("%Y%m%d-%H%M%S")
+        csv_filename = output_path(f'business_data_{timestamp}.csv')
+        json_filename = output_path(f'detailed_business_data_{timestamp}.jsonl')
+        writer = ResultWriter(csv_filename, json_filename, CSV_COLUMNS)
+        parquet_writer = None
+        if PARQUET_EXPORT:
+            parquet_filename = partition_path(search_for, time.strftime("%Y-%m-%d"), f'business_data_{timestamp}.parquet')
+            parquet_writer = ParquetResultWriter(parquet_filename)
+
+        def write_record(record):
+            writer.write(build_csv_row(record, search_for), build_detailed_record(record))
+            for claimer in claimers:
+                claimer.complete(record['place_id'], job_id)
+            if parquet_writer:
+                parquet_writer.write(build_parquet_row(
+                    record['listing'], record['website_data'], record['facebook'],
+                    extract_address_components(record['listing'].get('Address')), search_for
+                ))
+
+        # A resumed job picks every place up after the last stage it finished
+        resumed = journal.replay() if journal else None
+        if resumed and resumed['hrefs']:
+            for idx, (place_id, href) in enumerate(resumed['hrefs']):
+                harvester.hrefs[place_id] = href
+                place = resumed['places'].get(idx)
+                if place is None:
+                    detail_queue.put_nowait((idx, place_id, href))
+                    continue
+                record = {**place, 'place_id': place_id}
+                counters['places'] += 1
+                if 'facebook' in record:
+                    write_record(record)
+                elif 'website_data' in record:
+                    if facebook_links(record['website_data']):
+                        facebook_pages.expect()
+                    facebook_queue.put_nowait(record)
+                else:
+                    website_queue.put_nowait(record)
+            send_update({"status": "info", "message": f"Resuming job: {writer.count} of {len(harvester.hrefs)} places already done"})
 
-            listing_hrefs = []
-            for idx, listing in enumerate(listings):
+        async def discover():
+            try:
+                if resumed and (resumed['discovered'] or harvester.is_full()):
+                    return
+                async with pool.page() as page:
+                    send_update({"status": "info", "message": "Navigating to Google Maps..."})
+                    await page.goto("https://www.google.com/maps", timeout=60000)
+                    await page.wait_for_timeout(3000)
+
+                    send_update({"status": "info", "message": f"Searching for '{search_for}'..."})
+
+                    await page.wait_for_selector('//input[@id="searchboxinput"]', timeout=60000)
+                    search_box = page.locator('//input[@id="searchboxinput"]')
+                    await search_box.click()
+                    await search_box.fill(search_for)
+                    await page.keyboard.press("Enter")
+
+                    await page.wait_for_selector('//a[contains(@href, "https://www.google.com/maps/place")]', timeout=60000)
+                    await page.hover('//a[contains(@href, "https://www.google.com/maps/place")]')
+
+                    await harvester.harvest(page)
+
+                    send_update({"status": "info", "message": "Scrolling to find listings..."})
+                    while not harvester.is_full() and not is_cancelled():
+                        step_started = time.monotonic()
+                        await page.mouse.wheel(0, 10000)
+                        feed_state = await wait_for_feed_growth(page, scroll_idle_timeout)
+                        new_hrefs = await harvester.harvest(page)
+                        step_ms = int((time.monotonic() - step_started) * 1000)
+
+                        found = len(harvester.hrefs)
+                        if new_hrefs:
+                            send_update({"status": "progress", "message": f"Found {found} listings", "total": total, "current": found, "scroll_ms": step_ms})
+                        if feed_state == "end":
+                            send_update({"status": "info", "message": f"Reached the end of the results list. Found {found} results.", "scroll_ms": step_ms})
+                            break
+                        if feed_state == "idle":
+                            send_update({"status": "info", "message": f"No new results found within {scroll_idle_timeout} ms, stopping scroll. Found {found} results.", "scroll_ms": step_ms})
+                            break
+                if not is_cancelled():
+                    checkpoint('discovered', count=len(harvester.hrefs))
+            except Exception as e:
+                # The places harvested so far still drain through the pipeline;
+                # without a 'discovered' checkpoint a resume searches again
+                send_update({"status": "error", "message": f"Discovery stopped after {len(harvester.hrefs)} listings: {str(e)}"})
+            finally:
+                await detail_queue.put(None)
+
+        async def scrape_details(item):
+            idx, place_id, href = item
+            # Fresh cached details skip the place page entirely
+            listing_data = place_cache.get(place_id, field_groups) if place_cache and place_id else None
+            cached = listing_data is not None
+            if cached:
+                listing_data.update(skipped_fields(field_groups))
+                counters['cached'] += 1
+                send_update({"status": "progress", "message": f"Loaded listing {idx+1}/{len(harvester.hrefs)} from cache: {listing_data['Names']}", "total": len(harvester.hrefs), "current": idx+1})
+            else:
+                listing_data = await async_listing_scraper((idx, href, len(harvester.hrefs), search_for, timeout_count), pool, resource_policy, detail_limiter, field_groups)
+            # Failed listings, and pages that never rendered a name, are dropped; they
+            # stay out of the cache and the journal so a later run or resume retries them
+            if listing_data['Names'] in ("Null", ""):
+                counters['failed'] += 1
+                for claimer in claimers:
+                    claimer.release(job_id, place_id)
+                return None
+            if place_cache and place_id and not cached:
+                place_cache.put(place_id, listing_data, field_groups)
+            checkpoint('detail', idx=idx, listing=listing_data)
+            counters['places'] += 1
+            return {'idx': idx, 'place_id': place_id, 'listing': listing_data}
+
+        async def enrich_website(record):
+            counters['websites'] += 1
+            send_update({"status": "progress", "message": f"Processing website {counters['websites']}/{counters['places']}", "total": counters['places'], "current": counters['websites']})
+            record['website_data'] = await website_enricher.extract(record['listing']['Website'], website_memo)
+            checkpoint('website', idx=record['idx'], website_data=record['website_data'])
+            if facebook_links(record['website_data']):
+                facebook_pages.expect()
+            return record
+
+        async def enrich_facebook(record):
+            record['facebook'] = {'email_1': 'N/A', 'Facebook Intro': 'N/A'}
+            counters['facebook'] += 1
+            links = facebook_links(record['website_data'])
+            if links:
+                page = await facebook_pages.acquire()
                 try:
-                    href = await listing.locator('a.hfpxzc').get_attribute('href')
-                    if href:
-                        listing_hrefs.append(href)
-                    else:
-                        href = await listing.locator('a[jslog]').get_attribute('href')
-                        if href:
-                            listing_hrefs.append(href)
-                except Exception as e:
-                    send_update({"status": "error", "message": f"Error extracting href for listing {idx}: {str(e)}"})
-
-
-            async def bounded_gather(tasks, limit):
-                semaphore = asyncio.Semaphore(limit)
-                
-                async def bounded_task(task):
-                    async with semaphore:
-                        return await task
-                        
-                return await asyncio.gather(*[bounded_task(task) for task in tasks])
-
-            # Usage:
-            args_list = [(idx, href, len(listing_hrefs), search_for, timeout_count) 
-                        for idx, href in enumerate(listing_hrefs)]
-
-            tasks = [async_listing_scraper(arg, browser) for arg in args_list]
-            scraped_data = await bounded_gather(tasks, 10)  # Process 5 at a time
-# ``````````````````````````````````````````````````````````````````````````````````````````
-            df = pd.DataFrame(scraped_data)
-            df = df.drop_duplicates(subset=['Names'], keep='first')
-            for column in df.columns:
-                if df[column].nunique() == 1:
-                    df.drop(column, axis=1, inplace=True)
-
-            send_update({"status": "info", "message": "Extracting detailed website data..."})
-            extractor = WebsiteDataExtractor()
-            website_data = []
-
-            for i, website in enumerate(df['Website'].tolist()):
-                send_update({"status": "progress", "message": f"Processing website {i+1}/{len(df)}", "total": len(df), "current": i+1})
-                data = extractor.extract_structured_data(website)
-                website_data.append(data)
-                # time.sleep(1)
-
-            send_update({"status": "info", "message": "Processing extracted data..."})
-            df['Email'] = [data['contact_info']['emails'][0] if data['contact_info']['emails'] else 'N/A' for data in website_data]
-            df['Additional_Phones'] = [', '.join(data['contact_info']['phones']) if data['contact_info']['phones'] else 'N/A' for data in website_data]
-            df['Facebook'] = [', '.join(data['social_media'].get('facebook', [])) if data['social_media'].get('facebook') else 'N/A' for data in website_data]
-            df['Instagram'] = [', '.join(data['social_media'].get('instagram', [])) if data['social_media'].get('instagram') else 'N/A' for data in website_data]
-            df['Twitter'] = [', '.join(data['social_media'].get('twitter', [])) if data['social_media'].get('twitter') else 'N/A' for data in website_data]
-            df['Linkedin'] = [', '.join(data['social_media'].get('linkedin', [])) if data['social_media'].get('linkedin') else 'N/A' for data in website_data]
-            df['Youtube'] = [', '.join(data['social_media'].get('youtube', [])) if data['social_media'].get('youtube') else 'N/A' for data in website_data]
-            df['Business_Hours'] = [str(data['business_hours']) if data['business_hours'] else 'N/A' for data in website_data]
-
-            def extract_address_components(address):
-                if not address:
-                    return None, None, None, None
-                parts = address.split(', ')
-                street = parts[0] if parts else None
-                city = parts[1] if len(parts) > 1 else None
-                state = parts[2].split(' ')[0] if len(parts) > 2 else None
-                postal_code = parts[2].split(' ')[1] if len(parts) > 2 and len(parts[2].split(' ')) > 1 else None
-                return street, city, state, postal_code
-
-            df[['Street', 'City', 'State', 'Postal Code']] = df['Address'].apply(lambda x: pd.Series(extract_address_components(x)))
-
-            send_update({"status": "info", "message": "Extracting Facebook emails..."})
-            df['email_1'] = 'N/A'
-            df['Facebook Intro'] = 'N/A'
-
-            for index, row in enumerate(df.iterrows()):  # Regular for loop instead of async for
-                row = row[1]  # Get the actual row data
-                facebook_links = row['Facebook'].split(', ')
-                for link in facebook_links:
-                    if link != 'N/A':
+                    for link in links:
                         try:
-                            send_update({"status": "progress", "message": f"Processing Facebook link {index+1}/{len(df)}", "total": len(df), "current": index+1})
-                            temp_page = await browser.new_page()
-                            await temp_page.goto(link, timeout=60000)
-                            await temp_page.wait_for_timeout(5000)
-
-                            if await temp_page.locator('div[role="dialog"]').count() > 0:
-                                try:
-                                    close_button = temp_page.locator('div[role="dialog"] button[aria-label="Close"]')
-                                    if await close_button.count() > 0:
-                                        await close_button.hover()
-                                        await close_button.click()
-                                        await temp_page.wait_for_timeout(2000)
-                                except Exception as popup_error:
-                                    send_update({"status": "error", "message": f"Error closing popup on {link}: {popup_error}"})
-
-                            try:
-                                facebook_intro = await temp_page.locator('//div[@class="xieb3on"]/div/div/div/span').inner_text()
-                                df.at[index, 'Facebook Intro'] = facebook_intro
-                            except:
-                                df.at[index, 'Facebook Intro'] = "N/A"
-
-                            content = await temp_page.content()
-                            try:
-                                emails = re.findall(r'[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,}', content)
-                                if emails:
-                                    df.at[index, 'email_1'] = emails[0]
-                                else:
-                                    send_update({"status": "warning", "message": f"No email found on {link}"})
-                            except Exception as re_error:
-                                send_update({"status": "error", "message": f"Error finding emails on {link}: {re_error}"})
-
-                            await temp_page.close()
-
+                            send_update({"status": "progress", "message": f"Processing Facebook link {counters['facebook']}/{counters['places']}", "total": counters['places'], "current": counters['facebook']})
+                            await scrape_facebook_page(page, link, record)
                         except Exception as e:
-                            send_update({"status": "error", "message": f"Error navigating to {link}: {e}"})            # Add search query column with dynamic values
-            if not df.empty:  # Check if DataFrame is not empty
-                df['search_query'] = df.apply(
-                    lambda row: f"{search_for.split('in')[0].strip()}, {row['Postal Code']}, {row['City']}, {row['State']}, US",
-                    axis=1
-                )
-            else:
-                df['search_query'] = "N/A"  # If DataFrame is empty, search_query is "N/A"
-
-            # Email Validation and Cleaning
-            def clean_email(email):
-                if pd.isna(email) or email == 'N/A':
-                    return 'N/A'
-                email = email.lower()
-                cleaned_email = re.sub(r'[^a-z@.]', '', email)
-                return cleaned_email
-
-            df['Email'] = df['Email'].apply(clean_email)
-            df['email_1'] = df['email_1'].apply(clean_email)
-
-            send_update({"status": "info", "message": "Saving data to files..."})
-            timestamp = time.strftime("%Y%m%d-%H%M%S")
-            json_filename = f'detailed_business_data_{timestamp}.json'
-            csv_filename = f'business_data_{timestamp}.csv'
-            
+                            send_update({"status": "error", "message": f"Error navigating to {link}: {e}"})
+                finally:
+                    await facebook_pages.release(page)
+            checkpoint('record', idx=record['idx'], facebook=record['facebook'])
+            write_record(record)
+
+        def discard_results():
+            writer.discard()
+            if parquet_writer:
+                parquet_writer.discard()
+            checkpoint('cancelled')
+            send_update({"status": "warning", "message": "Job cancelled, finished places are kept in the job journal for a resume." if journal else "Job cancelled, discarding partial results."})
 
-                        # After you've collected all scraped_data and before saving to JSON, add this code:
-            for i, listing in enumerate(scraped_data):
-                if i < len(website_data):  # Make sure we don't go out of bounds
-                    # Add review data to the website_data
-                    website_data[i]['reviews'] = {
-                        'negative_reviews': [
-                            listing.get('Negative Review 1', 'N/A'),
-                            listing.get('Negative Review 2', 'N/A'),
-                            listing.get('Negative Review 3', 'N/A'),
-                            listing.get('Negative Review 4', 'N/A'),
-                            listing.get('Negative Review 5', 'N/A')
-                        ],
-                        'positive_reviews': [
-                            listing.get('Positive Review 1', 'N/A'),
-                            listing.get('Positive Review 2', 'N/A'),
-                            listing.get('Positive Review 3', 'N/A'),
-                            listing.get('Positive Review 4', 'N/A'),
-                            listing.get('Positive Review 5', 'N/A')
-                        ]
-                    }
-                    
-                    # Add atmosphere data
-                    website_data[i]['atmosphere'] = listing.get('Atmosphere', 'N/A')
-                    
-                    # Add map social media links
-                    website_data[i]['map_social_media'] = {
-                        'facebook': listing.get('Map Facebook', 'N/A'),
-                        'instagram': listing.get('Map Instagram', 'N/A')
-                    }
-            with open(json_filename, 'w') as f:
-                json.dump(website_data, f, indent=2)
-
-            df.to_csv(csv_filename, index=False)
-            send_update({"status": "success", "message": f"Data saved to {csv_filename} and {json_filename}", "csv_file": csv_filename, "json_file": json_filename})
-            
-            # Prepare combined data for API submission
-            # This includes both the detailed website data and the DataFrame data
-            combined_data = {
-                "search_query": search_for,
-                "timestamp": timestamp,
-                "listings_count": len(df),
-                "dataframe_data": json.loads(df.to_json(orient='records')),
-                "detailed_website_data": website_data
-            }
-            with open("API Data_"+json_filename, 'w') as f:
-                json.dump(combined_data, f, indent=4)
-            
-            # Send data to API if endpoint is provided
-            if api_endpoint:
-                send_update({"status": "info", "message": f"Sending data to API endpoint: {api_endpoint}"})
-                if send_to_api(combined_data, api_endpoint, api_key):
-                    send_update({"status": "success", "message": "Data successfully sent to API"})
-                else:
-                    send_update({"status": "error", "message": "Failed to send data to API"})
+        try:
+            await run_pipeline(
+                discover(),
+                run_adaptive_stage(detail_queue, website_queue, scrape_details, detail_limiter),
+                run_stage(website_queue, facebook_queue, enrich_website, WEBSITE_WORKERS),
+                run_stage(facebook_queue, None, enrich_facebook, FACEBOOK_WORKERS),
+            )
+        except asyncio.CancelledError:
+            # JobScheduler.cancel cancels the task, which would otherwise skip the check below
+            discard_results()
+            raise
+        finally:
+            await facebook_pages.close()
+            writer.close()
+            if parquet_writer:
+                parquet_writer.close()
+            for claimer in claimers:
+                claimer.release(job_id)
+        if is_cancelled():
+            discard_results()
+            return
+
+        blocked = resource_policy.stats()
+        send_update({"status": "info", "message": f"Blocked {blocked['blocked_requests']} requests on place pages (~{blocked['estimated_bytes_saved'] / 1048576:.1f} MB saved)", "resource_blocking": blocked})
+        http_cache = website_enricher.extractor.http_cache
+        if http_cache:
+            send_update({"status": "info", "message": f"Extracted {len(website_memo)} distinct websites", "http_cache": http_cache.stats()})
+        if place_cache:
+            send_update({"status": "info", "message": f"Loaded {counters['cached']} of {len(harvester.hrefs)} listings from the place cache", "place_cache": place_cache.stats()})
+
+        if harvester.skipped:
+            send_update({"status": "info", "message": f"Skipped {len(harvester.skipped)} places already covered by other jobs"})
+        if counters['failed']:
+            send_update({"status": "warning", "message": f"Dropped {counters['failed']} listings that could not be scraped"})
+
+        listings_count = writer.count
+        if OUTPUT_DEDUPE_COLUMNS or OUTPUT_PRUNE_COLUMNS:
+            send_update({"status": "info", "message": "Post-processing extracted data..."})
+            listings_count = postprocess_csv(csv_filename, json_filename)
+
+        send_update({"status": "success", "message": f"Data saved to {csv_filename} and {json_filename}", "csv_file": csv_filename, "json_file": json_filename})
+        if parquet_writer:
+            send_update({"status": "success", "message": f"Parquet export saved to {parquet_filename}", "parquet_file": os.path.relpath(parquet_filename, PARQUET_DIR)})
+        checkpoint('complete', csv_file=csv_filename, json_file=json_filename)
+
+        # The API document holds both the CSV rows and the detailed website data
+        api_filename = f"API Data_detailed_business_data_{timestamp}.json"
+        write_api_payload(api_filename, search_for, timestamp, csv_filename, json_filename, listings_count, CSV_COLUMN_TYPES)
+
+        # Send data to API if endpoint is provided
+        if api_endpoint:
+            send_update({"status": "info", "message": f"Sending data to API endpoint: {api_endpoint}"})
+            # Delivery blocks on HTTP retries and backoff, so it runs off the event loop
+            loop = asyncio.get_running_loop()
+            context = contextvars.copy_context()
+            delivered = await loop.run_in_executor(None, context.run, send_to_api, api_endpoint, api_key, search_for, timestamp,
+                                                   csv_filename, json_filename, listings_count)
+            if delivered:
+                send_update({"status": "success", "message": "Data successfully sent to API"})
             else:
-                send_update({"status": "warning", "message": "No API endpoint provided. Skipping API submission."})
-            
-            await browser.close()
-            
-        except Exception as e:
-            exc_type, exc_obj, exc_tb = traceback.sys.exc_info()
-            line_no = traceback.extract_tb(exc_tb)[-1][1]
-            send_update({"status": "error", "message": f"Scraper error: line no:{line_no} {str(e)}"})
-    
-    update_queue.put("DONE")
+                send_update({"status": "error", "message": "Failed to send data to API"})
+        else:
+            send_update({"status": "warning", "message": "No API endpoint provided. Skipping API submission."})
+
+    except Exception as e:
+        exc_type, exc_obj, exc_tb = traceback.sys.exc_info()
+        line_no = traceback.extract_tb(exc_tb)[-1][1]
+        send_update({"status": "error", "message": f"Scraper error: line no:{line_no} {str(e)}"})
+        if journal:
+            journal.append('failed', error=str(e))
 # Third fix: Correct the server startup and scraper launch
 def main(search_for=None, total=None, api_endpoint=None, api_key=None):
     # Get values from environment variables if not provided
@@ -1054,6 +1393,10 @@ def main(search_for=None, total=None, api_endpoint=None, api_key=None):
     #     daemon=True
     # )
     # server_thread.start()
+    prune_journals()
+    if RESUME_JOBS_ON_START:
+        resume_unfinished_jobs()
+
     def run_server():
         app.run(debug=False, host=host, port=port, use_reloader=False)
     run_server()    
@@ -0,0 +1,129 @@
+import os
+import sqlite3
+import threading
+import time
+import zlib
+
+HTTP_CACHE_PATH = os.getenv('HTTP_CACHE_PATH', os.path.join('cache', 'http.sqlite3'))
+# Seconds a cached website response is used without asking the server again;
+# older entries are revalidated with If-None-Match / If-Modified-Since
+HTTP_CACHE_MAX_AGE = int(os.getenv('HTTP_CACHE_MAX_AGE', 24 * 3600))
+# Compressed size of cached responses before least recently used ones are evicted
+HTTP_CACHE_MAX_BYTES = int(os.getenv('HTTP_CACHE_MAX_BYTES', 500 * 1024 * 1024))
+
+
+class CachedResponse:
+    def __init__(self, url, content_type, body, etag, last_modified, fetched_at):
+        self.url = url
+        self.content_type = content_type
+        self.body = body
+        self.etag = etag
+        self.last_modified = last_modified
+        self.fetched_at = fetched_at
+
+    def is_fresh(self, max_age):
+        return time.time() - self.fetched_at <= max_age
+
+    def conditional_headers(self):
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+
+class HttpCache:
+    def __init__(self, path=HTTP_CACHE_PATH, max_age=HTTP_CACHE_MAX_AGE, max_bytes=HTTP_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.revalidated = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS responses (
+                url TEXT PRIMARY KEY,
+                content_type TEXT NOT NULL,
+                body BLOB NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+        self._db.commit()
+
+    def get(self, url):
+        with self._lock:
+            row = self._db.execute(
+                'SELECT content_type, body, etag, last_modified, fetched_at FROM responses WHERE url = ?', (url,)
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (time.time(), url))
+            self._db.commit()
+        content_type, body, etag, last_modified, fetched_at = row
+        cached = CachedResponse(url, content_type, zlib.decompress(body), etag, last_modified, fetched_at)
+        if cached.is_fresh(self.max_age):
+            self.hits += 1
+        return cached
+
+    def put(self, url, content_type, body, etag=None, last_modified=None):
+        compressed = zlib.compress(bytes(body))
+        now = time.time()
+        with self._lock:
+            self._db.execute(
+                'INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, content_type, compressed, etag, last_modified, now, now, len(compressed))
+            )
+            self._db.commit()
+            self._evict()
+
+    def refresh(self, url):
+        # A 304 answer: the cached body is still current, restart its max age
+        with self._lock:
+            self.revalidated += 1
+            self._db.execute('UPDATE responses SET fetched_at = ? WHERE url = ?', (time.time(), url))
+            self._db.commit()
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for url, size in self._db.execute('SELECT url, size FROM responses ORDER BY accessed_at'):
+            if total <= self.max_bytes:
+                break
+            evicted.append((url,))
+            total -= size
+        self._db.executemany('DELETE FROM responses WHERE url = ?', evicted)
+        self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            entries, size = self._db.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses').fetchone()
+        return {'hits': self.hits, 'revalidated': self.revalidated, 'misses': self.misses, 'entries': entries, 'bytes': size}
+
+
+_http_cache = None
+_http_cache_lock = threading.Lock()
+
+
+def get_http_cache():
+    # None when caching is switched off with an empty HTTP_CACHE_PATH
+    global _http_cache
+    if not HTTP_CACHE_PATH:
+        return None
+    with _http_cache_lock:
+        if _http_cache is None:
+            _http_cache = HttpCache()
+        return _http_cache
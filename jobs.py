@@ -0,0 +1,340 @@
+import asyncio
+import contextvars
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+# Progress events kept per job for late subscribers and Last-Event-ID resume
+JOB_EVENT_BUFFER = int(os.getenv('JOB_EVENT_BUFFER', 1000))
+# Finished jobs kept in the registry before the oldest ones are dropped
+JOB_HISTORY = int(os.getenv('JOB_HISTORY', 100))
+# Jobs run at the same time; the rest wait in the scheduler's queue
+JOB_SLOTS = int(os.getenv('JOB_SLOTS', 2))
+# Seconds between SSE keep-alive comments while a job is quiet
+SSE_KEEPALIVE = 15
+
+COMPLETE_EVENT = {"status": "complete"}
+
+current_job = contextvars.ContextVar('current_job', default=None)
+
+
+class Job:
+    def __init__(self, job_id, params, max_events=JOB_EVENT_BUFFER):
+        self.id = job_id
+        self.params = params
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.state = 'created'
+        self.priority = 0
+        self.submitter = None
+        self.task = None
+        self.coro_factory = None
+        self.cancel_requested = False
+        self.parent = None
+        self.events = deque(maxlen=max_events)
+        self.last_event_id = 0
+        self.done = False
+        self._condition = threading.Condition()
+
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'state': self.state,
+            'params': {key: value for key, value in self.params.items() if key != 'api_key'},
+            'priority': self.priority,
+            'submitter': self.submitter,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at,
+            'last_event_id': self.last_event_id,
+        }
+
+    def publish(self, message):
+        with self._condition:
+            self.last_event_id += 1
+            self.events.append((self.last_event_id, message))
+            self._condition.notify_all()
+        if self.parent is not None:
+            self.parent.child_event(self, message)
+
+    def finish(self):
+        with self._condition:
+            if self.done:
+                return
+            self.last_event_id += 1
+            self.events.append((self.last_event_id, COMPLETE_EVENT))
+            self.done = True
+            self.finished_at = time.time()
+            self._condition.notify_all()
+        if self.parent is not None:
+            self.parent.child_finished(self)
+
+    def subscribe(self, last_event_id=0, keepalive=SSE_KEEPALIVE):
+        # Yields (event_id, message) pairs, or None as a keep-alive tick, until
+        # the job's completion event has been delivered.
+        while True:
+            with self._condition:
+                if self.last_event_id <= last_event_id and not self.done:
+                    self._condition.wait(timeout=keepalive)
+                pending = [(event_id, message) for event_id, message in self.events if event_id > last_event_id]
+                done = self.done
+            if not pending:
+                if done:
+                    return
+                yield None
+                continue
+            for event_id, message in pending:
+                last_event_id = event_id
+                yield event_id, message
+                if message is COMPLETE_EVENT:
+                    return
+
+
+class Sweep(Job):
+    # One search per location, each run as its own sub-job. A place claimed or
+    # written by one sub-job is skipped by the others; claims of places a
+    # sub-job did not write are released so a later location can pick them up.
+    # The sweep's channel carries the sub-jobs' events plus progress
+    # aggregated over all of them.
+    def __init__(self, job_id, params, max_events=JOB_EVENT_BUFFER):
+        super().__init__(job_id, params, max_events)
+        self.state = 'running'
+        self.started_at = self.created_at
+        self.children = []
+        self.places = set()
+        self.duplicates = 0
+        self._claims = {}  # place ID -> sub-job ID
+        self._lock = threading.Lock()
+        self._last_progress = 0.0
+
+    def to_dict(self):
+        return {
+            **super().to_dict(),
+            'children': [{'job_id': child.id, 'location': child.params.get('location'), 'state': child.state} for child in self.children],
+            'unique_places': len(self.places),
+            'duplicates_skipped': self.duplicates,
+        }
+
+    def add_child(self, job):
+        job.parent = self
+        self.children.append(job)
+
+    def claim(self, place_id, job_id):
+        with self._lock:
+            owner = self._claims.get(place_id)
+            if place_id in self.places or (owner is not None and owner != job_id):
+                self.duplicates += 1
+                return False
+            self._claims[place_id] = job_id
+            return True
+
+    def complete(self, place_id, job_id):
+        with self._lock:
+            self._claims.pop(place_id, None)
+            self.places.add(place_id)
+
+    def release(self, job_id, place_id=None):
+        with self._lock:
+            for claimed in [place_id] if place_id is not None else list(self._claims):
+                if self._claims.get(claimed) == job_id:
+                    del self._claims[claimed]
+
+    def child_event(self, child, message):
+        if message.get('status') != 'progress':
+            self.publish({**message, 'job_id': child.id, 'location': child.params.get('location')})
+        elif time.monotonic() - self._last_progress >= 1:
+            self.publish_progress()
+
+    def child_finished(self, child):
+        self.publish_progress()
+        if all(job.done for job in self.children):
+            self.state = 'cancelled' if self.cancel_requested else 'finished'
+            self.finish()
+
+    def publish_progress(self):
+        self._last_progress = time.monotonic()
+        finished = sum(1 for job in self.children if job.done)
+        self.publish({
+            "status": "progress",
+            "message": f"{finished}/{len(self.children)} locations finished, {len(self.places)} unique places, {self.duplicates} duplicates skipped",
+            "total": len(self.children),
+            "current": finished,
+            "unique_places": len(self.places),
+            "duplicates_skipped": self.duplicates,
+        })
+
+
+class JobRegistry:
+    def __init__(self, history=JOB_HISTORY):
+        self.history = history
+        self._jobs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self, params, job_id=None, job_class=Job):
+        job = job_class(job_id or uuid.uuid4().hex[:12], params)
+        with self._lock:
+            self._jobs[job.id] = job
+            finished = [job_id for job_id, existing in self._jobs.items() if existing.done]
+            for job_id in finished[:max(0, len(finished) - self.history)]:
+                del self._jobs[job_id]
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def latest(self):
+        with self._lock:
+            return next(reversed(self._jobs.values()), None)
+
+    def all(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+
+job_registry = JobRegistry()
+
+
+# Function to send updates to the client of the job running in this context
+def send_update(message):
+    job = current_job.get()
+    if job is None:
+        print(message)
+        return
+    job.publish(message)
+
+
+# Lets long-running loops stop early even when a bare except swallowed the task cancellation
+def is_cancelled():
+    job = current_job.get()
+    return job is not None and job.cancel_requested
+
+
+async def run_job(job, coro):
+    # The terminal state is set before the completion event goes out; a job
+    # whose cancellation was absorbed by the scraper still ends as cancelled
+    current_job.set(job)
+    state = 'finished'
+    try:
+        return await coro
+    except asyncio.CancelledError:
+        state = 'cancelled'
+        raise
+    except Exception:
+        state = 'failed'
+        raise
+    finally:
+        job.state = 'cancelled' if job.cancel_requested else state
+        job.finish()
+
+
+class JobScheduler:
+    # Runs submitted jobs on a fixed number of slots on the given event loop.
+    # Higher priorities go first; within a priority, submitters take turns so
+    # a large batch from one client cannot starve everyone else.
+    def __init__(self, slots=JOB_SLOTS):
+        self.slots = slots
+        self.loop = None
+        self.running = {}
+        self._queues = {}  # priority -> OrderedDict(submitter -> deque of jobs)
+        self._lock = threading.Lock()
+        self._wakeup = None
+
+    def start(self, loop):
+        self.loop = loop
+        asyncio.run_coroutine_threadsafe(self._start(), loop).result()
+        return self
+
+    async def _start(self):
+        self._wakeup = asyncio.Event()
+        for _ in range(self.slots):
+            asyncio.ensure_future(self._slot())
+
+    def submit(self, job, coro_factory, priority=0, submitter=None):
+        job.priority = priority
+        job.submitter = submitter or 'anonymous'
+        job.coro_factory = coro_factory
+        job.state = 'queued'
+        with self._lock:
+            submitters = self._queues.setdefault(priority, OrderedDict())
+            submitters.setdefault(job.submitter, deque()).append(job)
+        self.loop.call_soon_threadsafe(self._wakeup.set)
+        return job
+
+    def _next_job(self):
+        with self._lock:
+            for priority in sorted(self._queues, reverse=True):
+                submitters = self._queues[priority]
+                submitter, jobs = next(iter(submitters.items()))
+                job = jobs.popleft()
+                del submitters[submitter]
+                if jobs:
+                    submitters[submitter] = jobs  # back of the line
+                if not submitters:
+                    del self._queues[priority]
+                return job
+        return None
+
+    async def _slot(self):
+        while True:
+            self._wakeup.clear()
+            job = self._next_job()
+            if job is None:
+                await self._wakeup.wait()
+                continue
+            job.state = 'running'
+            job.started_at = time.time()
+            self.running[job.id] = job
+            job.task = asyncio.ensure_future(run_job(job, job.coro_factory()))
+            try:
+                await job.task
+            except (asyncio.CancelledError, Exception):
+                pass
+            finally:
+                del self.running[job.id]
+
+    def cancel(self, job):
+        job.cancel_requested = True
+        if isinstance(job, Sweep):
+            return any([self.cancel(child) for child in job.children])
+        with self._lock:
+            for priority, submitters in list(self._queues.items()):
+                jobs = submitters.get(job.submitter)
+                if jobs and job in jobs:
+                    jobs.remove(job)
+                    if not jobs:
+                        del submitters[job.submitter]
+                    if not submitters:
+                        del self._queues[priority]
+                    job.state = 'cancelled'
+                    job.finish()
+                    return True
+        if job.task is not None and not job.task.done():
+            self.loop.call_soon_threadsafe(job.task.cancel)
+            return True
+        return False
+
+    def queued(self):
+        with self._lock:
+            return [job for priority in sorted(self._queues, reverse=True) for jobs in self._queues[priority].values() for job in jobs]
+
+    def position(self, job):
+        queued = self.queued()
+        return queued.index(job) + 1 if job in queued else 0
+
+    def stats(self):
+        return {'slots': self.slots, 'running': len(self.running), 'queue_depth': len(self.queued())}
+
+
+def sse_stream(job, last_event_id=0):
+    yield f"data: {json.dumps({'status': 'info', 'message': f'Job {job.id} accepted', 'job_id': job.id})}\n\n"
+    for event in job.subscribe(last_event_id):
+        if event is None:
+            yield ": keep-alive\n\n"
+            continue
+        event_id, message = event
+        yield f"id: {event_id}\ndata: {json.dumps(message)}\n\n"
@@ -0,0 +1,110 @@
+import json
+import os
+import threading
+import time
+
+# Directory holding one journal file per job
+JOURNAL_DIR = os.getenv('JOURNAL_DIR', 'journals')
+# Seconds a journal is kept after its job completed, was cancelled or failed; 0 keeps them all
+JOURNAL_RETENTION = int(os.getenv('JOURNAL_RETENTION', 7 * 24 * 3600))
+
+# Last entry of a job that ended; a later 'resumed' entry makes the job unfinished again
+TERMINAL_ENTRIES = ('complete', 'cancelled', 'failed')
+
+
+class JobJournal:
+    # Append-only JSON Lines log of a job: its parameters, the hrefs found by
+    # discovery and each place as it leaves a pipeline stage. Replaying it lets
+    # a crashed or cancelled job continue where it stopped.
+    def __init__(self, job_id, directory=JOURNAL_DIR):
+        self.job_id = job_id
+        self.path = os.path.join(directory, f'{job_id}.jsonl')
+        os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._torn = self._ends_mid_line()
+
+    def _ends_mid_line(self):
+        if not self.exists() or os.path.getsize(self.path) == 0:
+            return False
+        with open(self.path, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) != b'\n'
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def append(self, entry_type, **fields):
+        line = json.dumps({'type': entry_type, 'time': time.time(), **fields})
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            if self._torn:
+                f.write('\n')  # end the line a crash cut short
+                self._torn = False
+            f.write(line + '\n')
+
+    def status(self):
+        # Type of the terminal entry the journal ends with, or None while the
+        # job is unfinished; reads only the tail instead of replaying the file
+        if not self.exists():
+            return None
+        with open(self.path, 'rb') as f:
+            offset = max(0, os.path.getsize(self.path) - 65536)
+            f.seek(offset)
+            lines = f.read().splitlines()
+        for line in reversed(lines[1:] if offset else lines):
+            try:
+                entry_type = json.loads(line)['type']
+            except ValueError:
+                continue  # line cut short by a crash
+            return entry_type if entry_type in TERMINAL_ENTRIES else None
+        return None
+
+    def replay(self):
+        state = {'params': None, 'hrefs': [], 'discovered': False, 'status': None, 'places': {}}
+        if not self.exists():
+            return state
+        with open(self.path, encoding='utf-8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # line cut short by a crash
+                entry_type = entry['type']
+                if entry_type == 'params':
+                    state['params'] = entry['params']
+                elif entry_type == 'href':
+                    state['hrefs'].append((entry['place_id'], entry['href']))
+                elif entry_type == 'discovered':
+                    state['discovered'] = True
+                elif entry_type in TERMINAL_ENTRIES:
+                    state['status'] = entry_type
+                elif entry_type == 'resumed':
+                    state['status'] = None
+                elif entry_type == 'detail':
+                    state['places'][entry['idx']] = {'idx': entry['idx'], 'listing': entry['listing']}
+                elif entry_type == 'website':
+                    state['places'][entry['idx']]['website_data'] = entry['website_data']
+                elif entry_type == 'record':
+                    state['places'][entry['idx']]['facebook'] = entry['facebook']
+        return state
+
+
+def all_journals(directory=JOURNAL_DIR):
+    if not os.path.isdir(directory):
+        return []
+    return [JobJournal(name[:-len('.jsonl')], directory) for name in sorted(os.listdir(directory)) if name.endswith('.jsonl')]
+
+
+# Jobs that stopped without a terminal entry, i.e. were interrupted by a crash or restart
+def unfinished_journals(directory=JOURNAL_DIR):
+    return [journal for journal in all_journals(directory) if journal.status() is None]
+
+
+def prune_journals(directory=JOURNAL_DIR, retention=JOURNAL_RETENTION):
+    if not retention:
+        return 0
+    removed = 0
+    for journal in all_journals(directory):
+        if journal.status() is not None and time.time() - os.path.getmtime(journal.path) > retention:
+            os.remove(journal.path)
+            removed += 1
+    return removed
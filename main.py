@@ -32,6 +32,16 @@ cities = [
 ]
 
 
-for city in cities:
-    respone= requests.get(f"http://192.168.1.39:5001/scrape?search_query=salon in {city}, austria")
-    print(respone) 
\ No newline at end of file
+# One sweep request instead of one blocking /scrape call per city; the server
+# runs the cities in parallel and skips places already found in another city
+response = requests.post("http://192.168.1.39:5001/sweeps", json={
+    "query_template": "salon in {location}, austria",
+    "locations": cities,
+})
+print(response)
+sweep = response.json()
+
+with requests.get(f"http://192.168.1.39:5001/stream?job_id={sweep['job_id']}", stream=True) as stream:
+    for line in stream.iter_lines(decode_unicode=True):
+        if line and line.startswith("data: "):
+            print(line[len("data: "):])
@@ -0,0 +1,162 @@
+import csv
+import gzip
+import itertools
+import json
+import math
+import os
+
+# Write the CSV and JSON Lines results gzip-compressed (.gz)
+OUTPUT_GZIP = os.getenv('OUTPUT_GZIP', 'False').lower() == 'true'
+# Optional post-processing passes over the finished CSV: drop rows repeating
+# these columns, and drop columns holding the same value in every row
+OUTPUT_DEDUPE_COLUMNS = [column for column in os.getenv('OUTPUT_DEDUPE_COLUMNS', '').split(',') if column]
+OUTPUT_PRUNE_COLUMNS = os.getenv('OUTPUT_PRUNE_COLUMNS', 'False').lower() == 'true'
+
+
+def output_path(filename):
+    return filename + '.gz' if OUTPUT_GZIP else filename
+
+
+def open_output(path, mode='r'):
+    if path.endswith('.gz'):
+        return gzip.open(path, mode + 't', encoding='utf-8', newline='')
+    return open(path, mode, encoding='utf-8', newline='')
+
+
+class ResultWriter:
+    # Writes each finished place as soon as it leaves the pipeline: one row
+    # with a fixed set of columns to the CSV and the detailed record to JSONL.
+    def __init__(self, csv_path, jsonl_path, columns):
+        self.csv_path = csv_path
+        self.jsonl_path = jsonl_path
+        self.columns = columns
+        self.count = 0
+        self._csv_file = open_output(csv_path, 'w')
+        self._csv = csv.DictWriter(self._csv_file, fieldnames=columns, extrasaction='ignore')
+        self._csv.writeheader()
+        self._jsonl_file = open_output(jsonl_path, 'w')
+
+    def write(self, row, detailed):
+        self._csv.writerow(row)
+        self._jsonl_file.write(json.dumps(detailed) + '\n')
+        self.count += 1
+
+    def close(self):
+        self._csv_file.close()
+        self._jsonl_file.close()
+
+    def discard(self):
+        self.close()
+        for path in (self.csv_path, self.jsonl_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _unique_rows(reader, dedupe_columns, dropped=None):
+    # Positions of the rows left out are added to `dropped`, if given
+    seen = set()
+    for position, row in enumerate(reader):
+        if dedupe_columns:
+            key = tuple(row.get(column) for column in dedupe_columns)
+            if key in seen:
+                if dropped is not None:
+                    dropped.add(position)
+                continue
+            seen.add(key)
+        yield row
+
+
+def _temp_path(path):
+    return os.path.join(os.path.dirname(path), '.tmp-' + os.path.basename(path))
+
+
+def postprocess_csv(path, jsonl_path=None, dedupe_columns=OUTPUT_DEDUPE_COLUMNS, prune_columns=OUTPUT_PRUNE_COLUMNS):
+    # Streams the CSV twice, once to find constant columns and once to rewrite
+    # it, so memory stays flat however many rows there are. The JSONL written
+    # alongside it loses the same rows, so the nth CSV row and the nth detailed
+    # record still belong to the same place. Returns the row count.
+    with open_output(path) as f:
+        reader = csv.DictReader(f)
+        columns = reader.fieldnames or []
+        first_values = {}
+        varying = set()
+        count = 0
+        for row in _unique_rows(reader, dedupe_columns):
+            count += 1
+            for column in columns:
+                value = row[column]
+                if first_values.setdefault(column, value) != value:
+                    varying.add(column)
+    if prune_columns and count:
+        columns = [column for column in columns if column in varying]
+    dropped = set()
+    with open_output(path) as source, open_output(_temp_path(path), 'w') as target:
+        writer = csv.DictWriter(target, fieldnames=columns, extrasaction='ignore')
+        writer.writeheader()
+        writer.writerows(_unique_rows(csv.DictReader(source), dedupe_columns, dropped))
+    os.replace(_temp_path(path), path)
+    if jsonl_path and dropped:
+        with open_output(jsonl_path) as source, open_output(_temp_path(jsonl_path), 'w') as target:
+            target.writelines(line for position, line in enumerate(source) if position not in dropped)
+        os.replace(_temp_path(jsonl_path), jsonl_path)
+    return count
+
+
+def _typed(value, cast):
+    try:
+        return cast(value)
+    except ValueError:
+        return value
+
+
+def iter_csv_records(csv_path, column_types=None):
+    # CSV text turned back into JSON values: empty cells become None and the
+    # columns in column_types (column -> int/float) numbers again
+    column_types = column_types or {}
+    with open_output(csv_path) as source:
+        for row in csv.DictReader(source):
+            yield {column: None if value == '' else _typed(value, column_types[column]) if column in column_types else value
+                   for column, value in row.items()}
+
+
+def iter_jsonl_records(jsonl_path):
+    with open_output(jsonl_path) as source:
+        for line in source:
+            yield json.loads(line)
+
+
+def iter_api_batches(search_query, timestamp, csv_path, jsonl_path, count, batch_size, column_types=None):
+    # Yields (batch number, document) pairs shaped like the API document, with
+    # up to batch_size rows of each list, read lazily from the result files;
+    # both files hold the same places in the same order
+    batch_count = max(1, math.ceil(count / batch_size))
+    rows = iter_csv_records(csv_path, column_types)
+    detailed = iter_jsonl_records(jsonl_path)
+    for batch in range(batch_count):
+        yield batch, {
+            "search_query": search_query,
+            "timestamp": timestamp,
+            "listings_count": count,
+            "batch": batch + 1,
+            "batch_count": batch_count,
+            "dataframe_data": list(itertools.islice(rows, batch_size)),
+            "detailed_website_data": list(itertools.islice(detailed, batch_size)),
+        }
+
+
+def write_api_payload(path, search_query, timestamp, csv_path, jsonl_path, count, column_types=None):
+    # Same document the API receives, written row by row from the result files
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write('{\n')
+        f.write(f'    "search_query": {json.dumps(search_query)},\n')
+        f.write(f'    "timestamp": {json.dumps(timestamp)},\n')
+        f.write(f'    "listings_count": {count},\n')
+        f.write('    "dataframe_data": [')
+        for i, row in enumerate(iter_csv_records(csv_path, column_types)):
+            f.write((',' if i else '') + '\n        ' + json.dumps(row))
+        f.write('\n    ],\n')
+        f.write('    "detailed_website_data": [')
+        with open_output(jsonl_path) as source:
+            for i, line in enumerate(source):
+                f.write((',' if i else '') + '\n        ' + line.rstrip('\n'))
+        f.write('\n    ]\n}\n')
@@ -0,0 +1,164 @@
+import ast
+import datetime
+import json
+import os
+import re
+
+from reviews import REVIEWS_PER_SORT
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = pq = None
+
+# Write a typed Parquet file per job next to the CSV/JSONL results (needs pyarrow)
+PARQUET_EXPORT = os.getenv('PARQUET_EXPORT', 'False').lower() == 'true'
+# Root of the Parquet dataset, partitioned as search_query=<query>/date=<YYYY-MM-DD>
+PARQUET_DIR = os.getenv('PARQUET_DIR', 'parquet')
+# Rows buffered before they are written out as a row group
+PARQUET_BATCH_SIZE = int(os.getenv('PARQUET_BATCH_SIZE', 500))
+
+MISSING_VALUES = ('', 'N/A', 'Null', None)
+
+if pa is not None:
+    STRINGS = pa.list_(pa.string())
+    PARQUET_SCHEMA = pa.schema([
+        ('name', pa.string()),
+        ('website', pa.string()),
+        ('introduction', pa.string()),
+        ('phone', pa.string()),
+        ('address', pa.string()),
+        ('street', pa.string()),
+        ('city', pa.string()),
+        ('state', pa.string()),
+        ('postal_code', pa.string()),
+        ('type', pa.string()),
+        ('opens_at', pa.string()),
+        ('review_count', pa.int64()),
+        ('average_rating', pa.float64()),
+        ('store_shopping', pa.bool_()),
+        ('in_store_pickup', pa.bool_()),
+        ('delivery', pa.bool_()),
+        ('reviews', pa.struct([('negative', STRINGS), ('positive', STRINGS)])),
+        ('atmosphere', STRINGS),
+        ('map_social_media', pa.struct([('facebook', pa.string()), ('instagram', pa.string())])),
+        ('contact', pa.struct([('emails', STRINGS), ('phones', STRINGS)])),
+        ('social_media', pa.struct([(platform, STRINGS) for platform in ('facebook', 'instagram', 'twitter', 'linkedin', 'youtube')])),
+        ('business_hours', pa.string()),
+        ('facebook_email', pa.string()),
+        ('facebook_intro', pa.string()),
+        ('query', pa.string()),
+        ('scraped_at', pa.timestamp('s')),
+    ])
+
+
+def text_or_none(value):
+    return None if value in MISSING_VALUES else str(value)
+
+
+def number_or_none(value, cast):
+    try:
+        return None if value in MISSING_VALUES else cast(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def yes_no(value):
+    return None if value in MISSING_VALUES else value == 'Yes'
+
+
+def parse_list_text(value):
+    # Atmosphere is kept as the inside of a Python list literal, e.g. "'Casual', 'Cozy'"
+    if value in MISSING_VALUES:
+        return []
+    try:
+        items = ast.literal_eval(f'[{value}]')
+        return [str(item) for item in items]
+    except (ValueError, SyntaxError):
+        return [value]
+
+
+# search_query and date are only kept in the directory names, as hive-style partitions
+def partition_path(search_query, date, filename, root=PARQUET_DIR):
+    query = re.sub(r'[^\w.-]+', '_', search_query.strip().lower()).strip('_') or 'all'
+    return os.path.join(root, f'search_query={query}', f'date={date}', filename)
+
+
+class ParquetResultWriter:
+    # Buffers typed rows and appends them to a single Parquet file as row groups
+    def __init__(self, path, batch_size=PARQUET_BATCH_SIZE):
+        if pa is None:
+            raise RuntimeError("PARQUET_EXPORT needs pyarrow: pip install pyarrow")
+        self.path = path
+        self.batch_size = batch_size
+        self.count = 0
+        self._rows = []
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._writer = pq.ParquetWriter(path, PARQUET_SCHEMA, compression='zstd')
+
+    def write(self, row):
+        self._rows.append(row)
+        self.count += 1
+        if len(self._rows) >= self.batch_size:
+            self._flush()
+
+    def _flush(self):
+        if self._rows:
+            self._writer.write_table(pa.Table.from_pylist(self._rows, schema=PARQUET_SCHEMA))
+            self._rows = []
+
+    def close(self):
+        if self._writer is not None:
+            self._flush()
+            self._writer.close()
+            self._writer = None
+
+    def discard(self):
+        self._rows = []
+        self.close()
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def build_parquet_row(listing, website_data, facebook, address_components, search_query):
+    street, city, state, postal_code = address_components
+    social_media = website_data['social_media']
+    return {
+        'name': text_or_none(listing.get('Names')),
+        'website': text_or_none(listing.get('Website')),
+        'introduction': text_or_none(listing.get('Introduction')),
+        'phone': text_or_none(listing.get('Phone Number')),
+        'address': text_or_none(listing.get('Address')),
+        'street': street,
+        'city': city,
+        'state': state,
+        'postal_code': postal_code,
+        'type': text_or_none(listing.get('Type')),
+        'opens_at': text_or_none(listing.get('Opens At')),
+        'review_count': number_or_none(listing.get('Review Count'), int),
+        'average_rating': number_or_none(listing.get('Average Review Count'), float),
+        'store_shopping': yes_no(listing.get('Store Shopping')),
+        'in_store_pickup': yes_no(listing.get('In Store Pickup')),
+        'delivery': yes_no(listing.get('Delivery')),
+        # Field groups a job skipped are None in the listing and stay null here
+        'reviews': None if listing.get('Negative Review 1') is None else {
+            'negative': [review for review in (listing.get(f'Negative Review {i}') for i in range(1, REVIEWS_PER_SORT + 1)) if review not in MISSING_VALUES],
+            'positive': [review for review in (listing.get(f'Positive Review {i}') for i in range(1, REVIEWS_PER_SORT + 1)) if review not in MISSING_VALUES],
+        },
+        'atmosphere': None if listing.get('Atmosphere') is None else parse_list_text(listing.get('Atmosphere')),
+        'map_social_media': None if listing.get('Map Facebook') is None else {
+            'facebook': text_or_none(listing.get('Map Facebook')),
+            'instagram': text_or_none(listing.get('Map Instagram')),
+        },
+        'contact': {
+            'emails': website_data['contact_info']['emails'],
+            'phones': website_data['contact_info']['phones'],
+        },
+        'social_media': {platform: social_media.get(platform, []) for platform in ('facebook', 'instagram', 'twitter', 'linkedin', 'youtube')},
+        'business_hours': json.dumps(website_data['business_hours']) if website_data['business_hours'] else None,
+        'facebook_email': text_or_none(facebook.get('email_1')),
+        'facebook_intro': text_or_none(facebook.get('Facebook Intro')),
+        'query': search_query,
+        'scraped_at': datetime.datetime.now().replace(microsecond=0),
+    }
@@ -0,0 +1,152 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+
+from reviews import REVIEWS_PER_SORT
+
+PLACE_CACHE_PATH = os.getenv('PLACE_CACHE_PATH', os.path.join('cache', 'places.sqlite3'))
+# Total size of cached place data before least recently used places are evicted
+PLACE_CACHE_MAX_BYTES = int(os.getenv('PLACE_CACHE_MAX_BYTES', 200 * 1024 * 1024))
+
+# listing_data keys stored under each field group
+FIELD_GROUPS = {
+    'core': ['Names', 'Website', 'Introduction', 'Phone Number', 'Address', 'Review Count', 'Average Review Count',
+             'Store Shopping', 'In Store Pickup', 'Delivery', 'Type', 'Opens At'],
+    'reviews': [f'{kind} Review {i}' for kind in ('Negative', 'Positive') for i in range(1, REVIEWS_PER_SORT + 1)],
+    'atmosphere': ['Atmosphere'],
+    'socials': ['Map Facebook', 'Map Instagram'],
+}
+
+# Seconds a field group stays fresh; reviews change much faster than a place's core info
+FIELD_GROUP_TTLS = {
+    'core': int(os.getenv('PLACE_CACHE_TTL_CORE', 7 * 24 * 3600)),
+    'reviews': int(os.getenv('PLACE_CACHE_TTL_REVIEWS', 24 * 3600)),
+    'atmosphere': int(os.getenv('PLACE_CACHE_TTL_ATMOSPHERE', 30 * 24 * 3600)),
+    'socials': int(os.getenv('PLACE_CACHE_TTL_SOCIALS', 7 * 24 * 3600)),
+}
+
+
+def parse_field_groups(value):
+    # "core,reviews" -> ['core', 'reviews']; core comes from the place page
+    # itself, so it is always scraped. None or empty selects every group.
+    if not value:
+        return list(FIELD_GROUPS)
+    requested = {group.strip() for group in (value.split(',') if isinstance(value, str) else value) if group.strip()}
+    unknown = requested - set(FIELD_GROUPS)
+    if unknown:
+        raise ValueError(f"unknown field groups {', '.join(sorted(unknown))}, expected some of {', '.join(FIELD_GROUPS)}")
+    return [group for group in FIELD_GROUPS if group == 'core' or group in requested]
+
+
+def skipped_fields(groups):
+    # Keys of the groups a job did not ask for, set to None so every listing has the same keys
+    return {key: None for group, keys in FIELD_GROUPS.items() if group not in groups for key in keys}
+
+
+def split_field_groups(listing_data):
+    groups = {}
+    for group, keys in FIELD_GROUPS.items():
+        groups[group] = {key: listing_data[key] for key in keys if key in listing_data}
+    grouped = {key for keys in FIELD_GROUPS.values() for key in keys}
+    extra = {key: value for key, value in listing_data.items() if key not in grouped}
+    groups['core'].update(extra)
+    return groups
+
+
+class PlaceCache:
+    def __init__(self, path=PLACE_CACHE_PATH, max_bytes=PLACE_CACHE_MAX_BYTES, ttls=FIELD_GROUP_TTLS):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.ttls = ttls
+        self.hits = 0
+        self.misses = 0
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS place_fields (
+                place_id TEXT NOT NULL,
+                field_group TEXT NOT NULL,
+                data TEXT NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL,
+                PRIMARY KEY (place_id, field_group)
+            )
+        ''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS place_fields_accessed ON place_fields (accessed_at)')
+        self._db.commit()
+
+    def get(self, place_id, groups=None):
+        # Returns the merged listing_data when every requested group is fresh, else None
+        groups = list(groups or FIELD_GROUPS)
+        now = time.time()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT field_group, data, fetched_at FROM place_fields WHERE place_id = ? AND field_group IN ({','.join('?' * len(groups))})",
+                [place_id, *groups]
+            ).fetchall()
+            fresh = {group: data for group, data, fetched_at in rows if now - fetched_at <= self.ttls.get(group, 0)}
+            if len(fresh) < len(groups):
+                self.misses += 1
+                return None
+            self._db.execute('UPDATE place_fields SET accessed_at = ? WHERE place_id = ?', (now, place_id))
+            self._db.commit()
+        self.hits += 1
+        listing_data = {}
+        for group in groups:
+            listing_data.update(json.loads(fresh[group]))
+        return listing_data
+
+    def put(self, place_id, listing_data, groups=None):
+        # Only the groups that were scraped are stored; the others keep their cached values
+        now = time.time()
+        rows = []
+        for group, data in split_field_groups(listing_data).items():
+            if data and (groups is None or group in groups):
+                encoded = json.dumps(data)
+                rows.append((place_id, group, encoded, now, now, len(encoded)))
+        with self._lock:
+            self._db.executemany('INSERT OR REPLACE INTO place_fields VALUES (?, ?, ?, ?, ?, ?)', rows)
+            self._db.commit()
+            self._evict()
+
+    def _evict(self):
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM place_fields').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        places = self._db.execute(
+            'SELECT place_id, SUM(size) FROM place_fields GROUP BY place_id ORDER BY MAX(accessed_at)'
+        ).fetchall()
+        evicted = []
+        for place_id, size in places:
+            if total <= self.max_bytes:
+                break
+            evicted.append((place_id,))
+            total -= size
+        self._db.executemany('DELETE FROM place_fields WHERE place_id = ?', evicted)
+        self._db.commit()
+
+    def stats(self):
+        with self._lock:
+            places, size = self._db.execute('SELECT COUNT(DISTINCT place_id), COALESCE(SUM(size), 0) FROM place_fields').fetchone()
+        return {'hits': self.hits, 'misses': self.misses, 'places': places, 'bytes': size}
+
+
+_place_cache = None
+_place_cache_lock = threading.Lock()
+
+
+def get_place_cache():
+    # None when caching is switched off with an empty PLACE_CACHE_PATH
+    global _place_cache
+    if not PLACE_CACHE_PATH:
+        return None
+    with _place_cache_lock:
+        if _place_cache is None:
+            _place_cache = PlaceCache()
+        return _place_cache
@@ -0,0 +1,73 @@
+import os
+import sqlite3
+import threading
+import time
+
+# SQLite file recording which places every job finished; when set, a place is
+# skipped at harvest time if another job finished it or is scraping it right now
+DEDUPE_INDEX_PATH = os.getenv('DEDUPE_INDEX_PATH', '')
+# Seconds after which a finished place may be scraped again by a later job
+DEDUPE_INDEX_TTL = int(os.getenv('DEDUPE_INDEX_TTL', 7 * 24 * 3600))
+
+
+class PlaceIndex:
+    # Place IDs claimed by running jobs are held in memory; a claim becomes a
+    # persistent row once the job has written the place out, and claims of a
+    # job that stops early are released so other jobs can pick them up.
+    def __init__(self, path=DEDUPE_INDEX_PATH, ttl=DEDUPE_INDEX_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.skipped = 0
+        self._claims = {}  # place ID -> job ID
+        self._lock = threading.Lock()
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute('''
+            CREATE TABLE IF NOT EXISTS places (
+                place_id TEXT PRIMARY KEY,
+                job_id TEXT,
+                completed_at REAL NOT NULL
+            )
+        ''')
+        self._db.commit()
+
+    def claim(self, place_id, job_id):
+        with self._lock:
+            owner = self._claims.get(place_id)
+            if owner is not None and owner != job_id:
+                self.skipped += 1
+                return False
+            row = self._db.execute('SELECT completed_at FROM places WHERE place_id = ?', (place_id,)).fetchone()
+            if row is not None and time.time() - row[0] <= self.ttl:
+                self.skipped += 1
+                return False
+            self._claims[place_id] = job_id
+            return True
+
+    def complete(self, place_id, job_id):
+        with self._lock:
+            self._claims.pop(place_id, None)
+            self._db.execute('INSERT OR REPLACE INTO places VALUES (?, ?, ?)', (place_id, job_id, time.time()))
+            self._db.commit()
+
+    def release(self, job_id, place_id=None):
+        with self._lock:
+            for claimed in [place_id] if place_id is not None else list(self._claims):
+                if self._claims.get(claimed) == job_id:
+                    del self._claims[claimed]
+
+
+_place_index = None
+_place_index_lock = threading.Lock()
+
+
+def get_place_index():
+    # None unless DEDUPE_INDEX_PATH is set; jobs then only dedupe their own results
+    global _place_index
+    if not DEDUPE_INDEX_PATH:
+        return None
+    with _place_index_lock:
+        if _place_index is None:
+            _place_index = PlaceIndex()
+        return _place_index
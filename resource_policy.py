@@ -0,0 +1,62 @@
+import os
+import re
+
+# Resource types aborted by default on place pages, which are only read for their text
+BLOCK_RESOURCE_TYPES = os.getenv('BLOCK_RESOURCE_TYPES', 'image,font,media')
+# Regexes for requests aborted regardless of type: map tiles, satellite imagery, street view and photos
+BLOCK_URL_PATTERNS = os.getenv('BLOCK_URL_PATTERNS', r'/maps/vt[/?],/kh/v=,streetviewpixels,/maps/preview/log,googleusercontent\.com/p/,\.(png|jpe?g|gif|webp|woff2?)(\?|$)')
+# Regexes for requests that are always let through, even when denied above
+ALLOW_URL_PATTERNS = os.getenv('ALLOW_URL_PATTERNS', '')
+
+# Rough transfer size per blocked request, used to estimate the bytes saved
+ESTIMATED_BYTES = {
+    'image': 40000,
+    'font': 30000,
+    'media': 250000,
+    'stylesheet': 20000,
+    'script': 60000,
+    'other': 15000,
+}
+
+
+def _split(value):
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+class ResourcePolicy:
+    def __init__(self, blocked_types=(), deny_patterns=(), allow_patterns=()):
+        self.blocked_types = set(blocked_types)
+        self.deny_patterns = [re.compile(pattern, re.I) for pattern in deny_patterns]
+        self.allow_patterns = [re.compile(pattern, re.I) for pattern in allow_patterns]
+        self.blocked = {}
+        self.allowed = 0
+
+    @classmethod
+    def from_env(cls):
+        return cls(_split(BLOCK_RESOURCE_TYPES), _split(BLOCK_URL_PATTERNS), _split(ALLOW_URL_PATTERNS))
+
+    def should_block(self, resource_type, url):
+        if any(pattern.search(url) for pattern in self.allow_patterns):
+            return False
+        if resource_type in self.blocked_types:
+            return True
+        return any(pattern.search(url) for pattern in self.deny_patterns)
+
+    async def handle(self, route, request):
+        if self.should_block(request.resource_type, request.url):
+            self.blocked[request.resource_type] = self.blocked.get(request.resource_type, 0) + 1
+            await route.abort()
+        else:
+            self.allowed += 1
+            await route.continue_()
+
+    async def install(self, context):
+        await context.route("**/*", self.handle)
+
+    def stats(self):
+        return {
+            'blocked_requests': sum(self.blocked.values()),
+            'allowed_requests': self.allowed,
+            'blocked_by_type': dict(self.blocked),
+            'estimated_bytes_saved': sum(count * ESTIMATED_BYTES.get(resource_type, ESTIMATED_BYTES['other']) for resource_type, count in self.blocked.items()),
+        }
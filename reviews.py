@@ -0,0 +1,131 @@
+import os
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# Lowest- and highest-rated reviews kept per place
+REVIEWS_PER_SORT = int(os.getenv('REVIEWS_PER_SORT', 5))
+# Upper bound for each condition-based wait in the review sort/expand sequence (ms)
+REVIEW_WAIT_TIMEOUT = int(os.getenv('REVIEW_WAIT_TIMEOUT', 3000))
+# "script" expands every review "More" button in one in-page call, "click" clicks them one by one
+REVIEW_EXPAND_MODE = os.getenv('REVIEW_EXPAND_MODE', 'script')
+# Scrolls of the review list while fewer than REVIEWS_PER_SORT reviews are loaded
+REVIEW_MAX_SCROLLS = int(os.getenv('REVIEW_MAX_SCROLLS', 5))
+
+SORT_BUTTON_XPATH = '//button/span/span[contains(text(),"Sort")]'
+MORE_BUTTONS_XPATH = '//button[contains(text(), "More")]'
+# Position of each order in the sort menu, reached with the arrow keys
+LOWEST_RATING_PRESSES = 3
+HIGHEST_RATING_PRESSES = 2
+
+# Fingerprint of the currently rendered review list, used to detect a re-render after sorting
+REVIEW_LIST_SIGNATURE_JS = """
+() => Array.from(document.querySelectorAll('div[data-review-id]')).slice(0, 3).map(el => el.getAttribute('data-review-id')).join('|')
+"""
+
+REVIEW_COUNT_JS = """
+() => document.querySelectorAll('div[data-review-id]').length
+"""
+
+# ID, star rating and text of every rendered review with text, in list order;
+# nested elements repeat the review ID, so callers dedupe by ID
+READ_REVIEWS_JS = """
+() => Array.from(document.querySelectorAll('div[data-review-id]')).map(el => {
+    const text = el.querySelector('.MyEned span.wiI7pd') || el.querySelector('.MyEned span');
+    const stars = el.querySelector('span[role="img"][aria-label]');
+    return {
+        id: el.getAttribute('data-review-id'),
+        rating: stars ? parseInt(stars.getAttribute('aria-label'), 10) || null : null,
+        text: text ? text.innerText.trim() : '',
+    };
+}).filter(review => review.text && review.text !== 'More')
+"""
+
+VISIBLE_MORE_BUTTONS = "Array.from(document.querySelectorAll('button')).filter(button => button.textContent.trim() === 'More' && button.offsetParent !== null)"
+
+# Clicks every visible "More" button at once and returns how many were clicked
+EXPAND_ALL_REVIEWS_JS = f"""
+() => {{
+    const buttons = {VISIBLE_MORE_BUTTONS};
+    buttons.forEach(button => button.click());
+    return buttons.length;
+}}
+"""
+
+ALL_REVIEWS_EXPANDED_JS = f"""
+() => {VISIBLE_MORE_BUTTONS}.length === 0
+"""
+
+
+async def wait_for_condition(page, expression, arg=None, timeout=REVIEW_WAIT_TIMEOUT):
+    try:
+        await page.wait_for_function(expression, arg=arg, timeout=timeout, polling=100)
+        return True
+    except PlaywrightTimeoutError:
+        return False
+
+
+async def sort_reviews(page, arrow_presses, sort_button=SORT_BUTTON_XPATH):
+    signature = await page.evaluate(REVIEW_LIST_SIGNATURE_JS)
+    await page.locator(sort_button).click()
+    try:
+        await page.wait_for_selector('//div[@role="menu"]', state="visible", timeout=REVIEW_WAIT_TIMEOUT)
+    except PlaywrightTimeoutError:
+        pass
+    for _ in range(arrow_presses):
+        await page.keyboard.press("ArrowDown")
+    await page.keyboard.press("Enter")
+    await wait_for_condition(page, f"(signature) => ({REVIEW_LIST_SIGNATURE_JS.strip()})() !== signature", signature)
+
+
+async def expand_reviews(page):
+    if REVIEW_EXPAND_MODE == "script":
+        if await page.evaluate(EXPAND_ALL_REVIEWS_JS):
+            await wait_for_condition(page, ALL_REVIEWS_EXPANDED_JS)
+        return
+    for index, button in enumerate(await page.locator(MORE_BUTTONS_XPATH).all()):
+        try:
+            if await button.is_visible():  # Click only if the button is visible
+                await button.click(timeout=REVIEW_WAIT_TIMEOUT)
+                await button.wait_for(state="hidden", timeout=REVIEW_WAIT_TIMEOUT)
+        except Exception as e:
+            print(f"Error clicking 'More' button {index + 1}: {e}")
+
+
+async def read_reviews(page, limit):
+    # Loads reviews until `limit` distinct ones are rendered or the list stops growing
+    seen = set()
+    reviews = []
+    for scroll in range(REVIEW_MAX_SCROLLS + 1):
+        await expand_reviews(page)
+        for review in await page.evaluate(READ_REVIEWS_JS):
+            if review['id'] not in seen:
+                seen.add(review['id'])
+                reviews.append(review)
+        if len(reviews) >= limit or scroll == REVIEW_MAX_SCROLLS:
+            break
+        review_count = await page.evaluate(REVIEW_COUNT_JS)
+        await page.mouse.wheel(0, 10000)
+        if not await wait_for_condition(page, f"(count) => ({REVIEW_COUNT_JS.strip()})() > count", review_count):
+            break
+    return reviews[:limit]
+
+
+async def collect_review_sets(page, limit=REVIEWS_PER_SORT, sort_button=SORT_BUTTON_XPATH):
+    # Lowest rated first, then highest rated: one sort each, never re-sorted
+    try:
+        await page.wait_for_selector(sort_button, timeout=60000)
+    except PlaywrightTimeoutError:
+        pass
+    await sort_reviews(page, LOWEST_RATING_PRESSES, sort_button)
+    negative = await read_reviews(page, limit)
+    await sort_reviews(page, HIGHEST_RATING_PRESSES, sort_button)
+    positive = await read_reviews(page, limit)
+    return negative, positive
+
+
+def review_columns(negative, positive, missing="N/A", limit=REVIEWS_PER_SORT):
+    columns = {}
+    for kind, reviews in (('Negative', negative), ('Positive', positive)):
+        for i in range(limit):
+            columns[f'{kind} Review {i + 1}'] = reviews[i]['text'] if i < len(reviews) else missing
+    return columns
@@ -0,0 +1,118 @@
+import gzip
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import delivery as delivery_module
+from delivery import ApiDelivery
+
+
+class StandInApi:
+    # Local HTTP server that records every request and answers the first
+    # `failures` of them with 503
+    def __init__(self):
+        self.requests = []
+        self.failures = 0
+        api = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                api.requests.append((dict(self.headers), body))
+                status = 503 if api.failures > 0 else 200
+                api.failures -= 1
+                self.send_response(status)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.endpoint = f'http://127.0.0.1:{self.server.server_port}/api'
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+@pytest.fixture
+def api():
+    api = StandInApi()
+    yield api
+    api.close()
+
+
+@pytest.fixture
+def delivery(tmp_path):
+    return ApiDelivery(max_retries=2, backoff=0, timeout=5, compress=True, outbox_dir=str(tmp_path / 'outbox'))
+
+
+DOCUMENT = {'search_query': 'salon in linz', 'batch': 1, 'batch_count': 1, 'dataframe_data': [{'Names': 'A', 'Review Count': 12}]}
+
+
+def test_retries_503_with_the_same_idempotency_key(api, delivery):
+    api.failures = 2
+    assert delivery.send_batch(api.endpoint, 'secret', DOCUMENT, 'key-1')
+    assert len(api.requests) == 3
+    assert {headers['Idempotency-Key'] for headers, _ in api.requests} == {'key-1'}
+
+
+def test_sends_a_gzip_body(api, delivery):
+    assert delivery.send_batch(api.endpoint, 'secret', DOCUMENT, 'key-1')
+    headers, body = api.requests[0]
+    assert headers['Content-Encoding'] == 'gzip'
+    assert headers['Authorization'] == 'Bearer secret'
+    assert json.loads(gzip.decompress(body)) == DOCUMENT
+
+
+def test_failed_batch_goes_to_the_outbox_without_the_api_key(api, delivery):
+    api.failures = 3
+    assert delivery.deliver(api.endpoint, 'secret', [('key-1', DOCUMENT)]) == (0, 1)
+    assert delivery.pending() == ['key-1']
+    with gzip.open(delivery._outbox_path('key-1'), 'rt', encoding='utf-8') as f:
+        entry = json.load(f)
+    assert entry['document'] == DOCUMENT
+    assert 'secret' not in json.dumps(entry)
+
+
+def test_replay_outbox_removes_delivered_batches(api, delivery):
+    api.failures = 3
+    delivery.deliver(api.endpoint, 'secret', [('key-1', DOCUMENT)])
+    assert delivery.replay_outbox() == (1, 0)
+    assert delivery.pending() == []
+    headers, body = api.requests[-1]
+    assert headers['Idempotency-Key'] == 'key-1'
+    assert headers['Authorization'] == 'Bearer secret'
+    assert json.loads(gzip.decompress(body)) == DOCUMENT
+
+
+def test_replay_outbox_keeps_batches_that_still_fail(api, delivery):
+    api.failures = 4
+    delivery.deliver(api.endpoint, 'secret', [('key-1', DOCUMENT)])
+    assert delivery.replay_outbox() == (0, 1)
+    assert delivery.pending() == ['key-1']
+
+
+def test_replay_never_sends_the_default_key_to_other_endpoints(api, tmp_path, monkeypatch):
+    monkeypatch.setattr(delivery_module, 'API_KEY', 'server-secret')
+    monkeypatch.setattr(delivery_module, 'API_DEFAULT_ENDPOINT', 'http://api.example/api')
+    api.failures = 3
+    ApiDelivery(max_retries=2, backoff=0, outbox_dir=str(tmp_path / 'outbox')).deliver(api.endpoint, '', [('key-1', DOCUMENT)])
+    # A fresh instance, as after a restart: no key is remembered for the endpoint
+    assert ApiDelivery(backoff=0, outbox_dir=str(tmp_path / 'outbox')).replay_outbox() == (1, 0)
+    headers, _ = api.requests[-1]
+    assert 'Authorization' not in headers
+
+
+def test_replay_with_an_api_key_only_sends_that_endpoints_batches(api, delivery, tmp_path):
+    api.failures = 3
+    delivery.deliver(api.endpoint, '', [('key-1', DOCUMENT)])
+    delivery._to_outbox('http://127.0.0.1:9/other', 'key-2', DOCUMENT)
+    assert delivery.replay_outbox(api.endpoint, 'given-key') == (1, 0)
+    assert delivery.pending() == ['key-2']
+    headers, _ = api.requests[-1]
+    assert headers['Authorization'] == 'Bearer given-key'
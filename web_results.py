@@ -0,0 +1,107 @@
+import os
+from urllib.parse import parse_qs, urljoin, urlparse
+
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# Click a web result card and read the opened tab when its link cannot be read from the page
+WEB_RESULTS_POPUP_FALLBACK = os.getenv('WEB_RESULTS_POPUP_FALLBACK', 'True').lower() != 'false'
+# Upper bound for waiting on a fallback popup tab (ms)
+WEB_RESULTS_POPUP_TIMEOUT = int(os.getenv('WEB_RESULTS_POPUP_TIMEOUT', 10000))
+
+WEB_RESULTS_IFRAME_XPATH = "//iframe[@class='rvN3ke']"
+WEB_RESULT_CARDS_XPATH = '//div[@role="heading"]/parent::g-card-section/parent::div/parent::div'
+
+# Query parameters Google's redirect URLs (/url, /aclk) carry the target in
+REDIRECT_TARGET_PARAMS = ('url', 'q', 'adurl')
+SOCIAL_HOSTS = {'instagram.com': 'instagram', 'facebook.com': 'facebook'}
+
+# Every link candidate of each card: href, data-href and the ping URL of the
+# anchors inside it, plus the anchor wrapping the card if there is one
+CARD_LINKS_JS = """
+cards => cards.map(card => {
+    const anchors = Array.from(card.querySelectorAll('a'));
+    const wrapper = card.closest('a');
+    if (wrapper) anchors.unshift(wrapper);
+    const links = [];
+    for (const anchor of anchors) {
+        for (const name of ['href', 'data-href', 'ping']) {
+            const value = anchor.getAttribute(name);
+            if (value) links.push(value);
+        }
+    }
+    return links;
+})
+"""
+
+
+def decode_google_redirect(link):
+    # "/url?q=https://www.instagram.com/x/&sa=..." -> "https://www.instagram.com/x/"
+    url = urljoin('https://www.google.com/', link)
+    parsed = urlparse(url)
+    if parsed.hostname and 'google.' in parsed.hostname and parsed.path in ('/url', '/aclk'):
+        query = parse_qs(parsed.query)
+        for param in REDIRECT_TARGET_PARAMS:
+            for target in query.get(param, []):
+                if target.startswith(('http://', 'https://')):
+                    return decode_google_redirect(target)
+        return None
+    return url if parsed.scheme in ('http', 'https') else None
+
+
+def social_profile(url):
+    # (platform, profile URL) for a link to a single Facebook or Instagram page, else None
+    parsed = urlparse(url)
+    host = (parsed.hostname or '').lower()
+    for prefix in ('www.', 'm.', 'web.'):
+        host = host[len(prefix):] if host.startswith(prefix) else host
+    segments = [segment for segment in parsed.path.split('/') if segment]
+    if host not in SOCIAL_HOSTS or len(segments) != 1 or segments[0] == 'profile.php':
+        return None
+    return SOCIAL_HOSTS[host], f'https://www.{host}/{segments[0]}/'
+
+
+def resolve_card_link(links):
+    # First link of a card that leads off Google, decoding redirects on the way
+    for link in links:
+        url = decode_google_redirect(link)
+        if url and 'google.' not in (urlparse(url).hostname or ''):
+            return url
+    return None
+
+
+async def open_card_popup(page, card):
+    async with page.expect_popup(timeout=WEB_RESULTS_POPUP_TIMEOUT) as popup_info:
+        await card.click()
+    popup = await popup_info.value
+    try:
+        await popup.wait_for_url(lambda url: not url.startswith('about:'), timeout=WEB_RESULTS_POPUP_TIMEOUT)
+    except PlaywrightTimeoutError:
+        pass
+    url = popup.url
+    await popup.close()
+    return url
+
+
+async def resolve_map_socials(page):
+    # Reads the Facebook and Instagram links of a place's web results straight
+    # from the card anchors; a card is only clicked open in a new tab when
+    # none of its links could be resolved
+    profiles = {}
+    cards = page.frame_locator(WEB_RESULTS_IFRAME_XPATH).locator(WEB_RESULT_CARDS_XPATH)
+    card_links = await cards.evaluate_all(CARD_LINKS_JS)
+    popups = 0
+    for index, links in enumerate(card_links):
+        if len(profiles) == len(SOCIAL_HOSTS):
+            break
+        url = resolve_card_link(links)
+        if url is None and WEB_RESULTS_POPUP_FALLBACK:
+            popups += 1
+            try:
+                url = await open_card_popup(page, cards.nth(index))
+            except PlaywrightTimeoutError:
+                continue
+        profile = social_profile(url) if url else None
+        if profile:
+            profiles.setdefault(*profile)
+    print(f"Resolved {len(card_links)} web results with {popups} popups:", profiles)
+    return profiles.get('facebook', "N/A"), profiles.get('instagram', "N/A")